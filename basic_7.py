@@ -1,3 +1,23 @@
+import ast
+import builtins
+import gc
+import hashlib
+import itertools
+import marshal
+import mmap
+import os
+import pickle
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+import weakref
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from bisect import bisect_left, bisect_right
+from collections import Counter, deque
 
 
 TK_INT = 'INT'
@@ -57,6 +77,10 @@ KEYWORDS = [
     'end',
     'for',
     'while',
+    'endwhile',
+    'to',
+    'step',
+    'endfor',
     'switch',
     'case',
     'default',
@@ -65,12 +89,73 @@ KEYWORDS = [
     'continue'
 ]
 
+KEYWORD_KINDS = {keyword: TK_KEYWORD for keyword in KEYWORDS}
+KEYWORD_KINDS['div'] = TK_DIV
+KEYWORD_KINDS['mod'] = TK_MOD
+
+# Line-start offsets of a source, built on the first diagnostic that needs them
+class LineIndex:
+    def __init__(self, text):
+        self.text = text
+        self.starts = None
+        # offsets of the UTF-8 continuation bytes of a bytes source, kept
+        # instead of the source once the index is pickled
+        self.continuations = None
+
+    def build(self):
+        newline = '\n' if isinstance(self.text, str) else b'\n'
+        self.starts = array('I', [0])
+        self.starts.extend(m.end() for m in re.finditer(newline, self.text))
+
+    # a cached tree keeps the line table; columns of a str source need only
+    # that, those of a bytes source the continuation bytes before them
+    def __getstate__(self):
+        if self.starts is None:
+            self.build()
+        if isinstance(self.text, str):
+            return {'text': '', 'starts': self.starts, 'continuations': None}
+        continuations = self.continuations
+        if continuations is None:
+            continuations = array('I', (m.start() for m in re.finditer(rb'[\x80-\xbf]', self.text)))
+        return {'text': None, 'starts': self.starts, 'continuations': continuations}
+
+    def position(self, offset):
+        if self.starts is None:
+            self.build()
+        line = bisect_right(self.starts, offset)
+        start = self.starts[line - 1]
+        if isinstance(self.text, str):
+            return line, offset - start
+        if self.text is None:
+            continuations = self.continuations
+            return line, offset - start - (bisect_left(continuations, offset) - bisect_left(continuations, start))
+        # byte offsets: count characters, decoding just the start of this line
+        return line, len(self.text[start:offset].decode('utf-8', 'replace'))
+
+
 class Token:
-    def __init__(self, type, value, line, column):
+    __slots__ = ('type', 'value', 'pos', 'lines')
+
+    def __init__(self, type, value, pos, lines=None):
         self.type = type
         self.value = value
-        self.line = line
-        self.column = column
+        self.pos = pos
+        self.lines = lines
+
+    @property
+    def line(self):
+        if self.lines is None:
+            return None
+        return self.lines.position(self.pos)[0]
+
+    @property
+    def column(self):
+        if self.lines is None:
+            return None
+        return self.lines.position(self.pos)[1]
+
+    def __reduce__(self):
+        return Token, (self.type, self.value, self.pos, self.lines)
 
     def match(self, type, value):
         return self.type == type and self.value == value
@@ -85,20 +170,19 @@ class Token:
 class Lexer:
     def __init__(self, text):
         self.text = text
+        self.lines = LineIndex(text)
         self.pos = 0
-        self.column = 0
-        self.line = 1
         self.current_char = self.text[self.pos]
         self.size = len(self.text)
     
     def error(self,msg):
-        print("Invalid character '{}' found at line: {}, column: {}".format(msg,self.line, self.column))
+        line, column = self.lines.position(self.pos)
+        print("Invalid character '{}' found at line: {}, column: {}".format(msg, line, column))
         exit(1)
 
     
     def advance(self):
         self.pos += 1
-        self.column += 1
         if self.pos < self.size:
             self.current_char = self.text[self.pos]
         else:
@@ -109,6 +193,7 @@ class Lexer:
             self.advance()
     
     def integer(self):
+        start = self.pos
         result = ''
         while self.current_char is not None and self.current_char.isdigit():
             result += self.current_char
@@ -120,62 +205,58 @@ class Lexer:
             while self.current_char is not None and self.current_char.isdigit():
                 result += self.current_char
                 self.advance()
-            token = Token(TK_FLOAT, float(result), self.line, self.column)
+            token = Token(TK_FLOAT, float(result), start, self.lines)
         else:
-            token = Token(TK_INT, int(result), self.line, self.column)
+            token = Token(TK_INT, int(result), start, self.lines)
         return token
 
     def identifier(self):
+        start = self.pos
         result = ''
         while self.current_char is not None and self.current_char.isalnum() or self.current_char == '_':
             result += self.current_char
             self.advance()
-        id_str = result.lower()
-        if id_str in KEYWORDS:
-            if (id_str == 'div'):
-                return Token(TK_DIV, id_str, self.line, self.column)
-            elif (id_str == 'mod'):
-                return Token(TK_MOD, id_str, self.line, self.column)
-            else:
-                return Token(TK_KEYWORD, id_str, self.line, self.column)
-
-        else:
-            return Token(TK_IDENTIFIER, id_str, self.line, self.column)
-        return None
+        id_str = sys.intern(result.lower())
+        return Token(KEYWORD_KINDS.get(id_str, TK_IDENTIFIER), id_str, start, self.lines)
 
     def not_equal(self):
+        start = self.pos
         self.advance()
         if self.current_char == '=':
             self.advance()
-            return Token(TK_OP_NOT_EQUAL, '!=', self.line, self.column)
+            return Token(TK_OP_NOT_EQUAL, '!=', start, self.lines)
         else:
             self.error("Expected '=' after '!'")
                   
     def equal(self):
+        start = self.pos
         self.advance()
         if self.current_char == '=':
             self.advance()
-            return Token(TK_OP_EQUAL_EQUAL, '==', self.line, self.column)
+            return Token(TK_OP_EQUAL_EQUAL, '==', start, self.lines)
         else:
-            return Token(TK_EQ, '=', self.line, self.column)
+            return Token(TK_EQ, '=', start, self.lines)
     
     def less_than(self):
+        start = self.pos
         self.advance()
         if self.current_char == '=':
             self.advance()
-            return Token(TK_OP_LESS_EQUAL, '<=', self.line, self.column)
+            return Token(TK_OP_LESS_EQUAL, '<=', start, self.lines)
         else:
-            return Token(TK_OP_LESS, '<', self.line, self.column)
+            return Token(TK_OP_LESS, '<', start, self.lines)
         
     def greater_than(self):
+        start = self.pos
         self.advance()
         if self.current_char == '=':
             self.advance()
-            return Token(TK_OP_GREATER_EQUAL, '>=', self.line, self.column)
+            return Token(TK_OP_GREATER_EQUAL, '>=', start, self.lines)
         else:
-            return Token(TK_OP_GREATER, '>', self.line, self.column)
+            return Token(TK_OP_GREATER, '>', start, self.lines)
         
     def string(self):
+        start = self.pos
         result = ''
         self.advance()
         while self.current_char is not None and self.current_char != '"':
@@ -183,7 +264,8 @@ class Lexer:
             self.advance()
         if self.current_char == '"':
             self.advance()
-            return Token(TK_STRING, result, self.line, self.column)
+            return Token(TK_STRING, result, start, self.lines)
+        self.error('"')
         
     def peek(self):
         peek_pos = self.pos + 1
@@ -194,114 +276,455 @@ class Lexer:
     
         
     def get_next_token(self):
-        tokens = []
+        return list(self.tokens())
 
+    def tokens(self):
         while self.current_char is not None:
             if self.current_char.isspace():
-                if self.current_char == '\n':
-                    self.line += 1
-                    self.column = 0
-                    token = Token(TK_NEWLINE, ' ', self.line, self.column)
                 self.skip_whitespace()
                 continue
             
             if self.current_char.isdigit():
                 token=  self.integer()
-                tokens.append(token)
+                yield token
             
             elif self.current_char.isalpha() or self.current_char == '_':
                 token = self.identifier()
-                tokens.append(token)
+                yield token
             
             
             elif self.current_char == '+':
-                token = Token(TK_PLUS, '+', self.line, self.column)
+                token = Token(TK_PLUS, '+', self.pos, self.lines)
                 self.advance()
-                tokens.append(token)
+                yield token
            
             elif self.current_char == '^':
-                token = Token(TK_POW, '^', self.line, self.column)
+                token = Token(TK_POW, '^', self.pos, self.lines)
                 self.advance()
-                tokens.append(token)
+                yield token
              
             elif self.current_char == '%':
-                token = Token(TK_MOD, '%', self.line, self.column)
+                token = Token(TK_MOD, '%', self.pos, self.lines)
                 self.advance()
-                tokens.append(token)
+                yield token
 
             elif self.current_char == '-':
-                token = Token(TK_MINUS, '-', self.line, self.column)
+                token = Token(TK_MINUS, '-', self.pos, self.lines)
                 self.advance()
-                tokens.append(token)
+                yield token
            
             
             elif self.current_char == '*':
-                token = Token(TK_MUL, '*', self.line, self.column)
+                token = Token(TK_MUL, '*', self.pos, self.lines)
                 self.advance()
-                tokens.append(token)
+                yield token
              
             
             elif self.current_char == '/':
-                token = Token(TK_DIV, '/', self.line, self.column)
+                token = Token(TK_DIV, '/', self.pos, self.lines)
                 self.advance()
-                tokens.append(token)
+                yield token
             elif self.current_char == ',':
-                token = Token(TK_COMMA, ',', self.line, self.column)
+                token = Token(TK_COMMA, ',', self.pos, self.lines)
                 self.advance()
-                tokens.append(token)
+                yield token
             elif self.current_char == ';':
-                token = Token(TK_SEMICOLON, ';', self.line, self.column)
+                token = Token(TK_SEMICOLON, ';', self.pos, self.lines)
                 self.advance()
-                tokens.append(token)
+                yield token
             elif self.current_char == ':':
-                token = Token(TK_COLON, ':', self.line, self.column)
+                token = Token(TK_COLON, ':', self.pos, self.lines)
                 self.advance()
-                tokens.append(token)
+                yield token
             elif self.current_char == '=':
                 token = self.equal()
-                tokens.append(token)
+                yield token
             elif self.current_char == '!':
                 token = self.not_equal()
-                tokens.append(token)
+                yield token
             elif self.current_char == '<':
                 token = self.less_than()
-                tokens.append(token)
+                yield token
             elif self.current_char == '>':
                 token = self.greater_than()
-                tokens.append(token)
+                yield token
             elif self.current_char == '"':
                 token = self.string()
-                tokens.append(token)
+                yield token
             elif self.current_char == '{':
-                token = Token(TK_LBRACE, '{', self.line, self.column)
+                token = Token(TK_LBRACE, '{', self.pos, self.lines)
                 self.advance()
-                tokens.append(token)
+                yield token
             elif self.current_char == '}':
-                token = Token(TK_RBRACE, '}', self.line, self.column)
+                token = Token(TK_RBRACE, '}', self.pos, self.lines)
                 self.advance()
-                tokens.append(token)
+                yield token
             elif self.current_char == '(':
-                token = Token(TK_LPAREN, '(', self.line, self.column)
+                token = Token(TK_LPAREN, '(', self.pos, self.lines)
                 self.advance()
-                tokens.append(token)
+                yield token
             elif self.current_char == ')':
-                token = Token(TK_RPAREN, ')', self.line, self.column)
+                token = Token(TK_RPAREN, ')', self.pos, self.lines)
                 self.advance()
-                tokens.append(token)
+                yield token
             else:  
                 self.error(self.current_char)
         
-        token = Token('EOF', None, self.line, self.column)
-        tokens.append(token)
-        return tokens
+        yield Token('EOF', None, self.pos, self.lines)
+
+
+OPERATORS = {
+    '+': TK_PLUS,
+    '-': TK_MINUS,
+    '*': TK_MUL,
+    '/': TK_DIV,
+    '^': TK_POW,
+    '%': TK_MOD,
+    ',': TK_COMMA,
+    ';': TK_SEMICOLON,
+    ':': TK_COLON,
+    '=': TK_EQ,
+    '==': TK_OP_EQUAL_EQUAL,
+    '!=': TK_OP_NOT_EQUAL,
+    '<': TK_OP_LESS,
+    '<=': TK_OP_LESS_EQUAL,
+    '>': TK_OP_GREATER,
+    '>=': TK_OP_GREATER_EQUAL,
+    '{': TK_LBRACE,
+    '}': TK_RBRACE,
+    '(': TK_LPAREN,
+    ')': TK_RPAREN,
+}
+
+TOKEN_PATTERN = re.compile(r'''\s*(?:
+    (\d+(?:\.\d*)?)
+  | ([^\W\d]\w*)
+  | (==|!=|<=|>=|[-+*/^%,;:=<>{}()])
+  | ("[^"]*")
+  | (\S)
+)''', re.VERBOSE)
+
+PATTERN_NUMBER, PATTERN_NAME, PATTERN_OP, PATTERN_STRING, PATTERN_ERROR = range(1, 6)
+
+
+# Same token stream as Lexer, but one compiled alternation does the scanning
+class RegexLexer(Lexer):
+    def __init__(self, text):
+        self.text = text
+        self.lines = LineIndex(text)
+        self.pos = 0
+
+    def tokens(self, start=0):
+        text = self.text
+        lines = self.lines
+        intern = sys.intern
+        keyword_kind = KEYWORD_KINDS.get
+
+        for m in TOKEN_PATTERN.finditer(text, start):
+            kind = m.lastindex
+            start = m.start(kind)
+            if kind == PATTERN_NAME:
+                id_str = intern(m.group(kind).lower())
+                yield Token(keyword_kind(id_str, TK_IDENTIFIER), id_str, start, lines)
+            elif kind == PATTERN_OP:
+                value = m.group(kind)
+                yield Token(OPERATORS[value], value, start, lines)
+            elif kind == PATTERN_NUMBER:
+                value = m.group(kind)
+                if '.' in value:
+                    yield Token(TK_FLOAT, float(value), start, lines)
+                else:
+                    yield Token(TK_INT, int(value), start, lines)
+            elif kind == PATTERN_STRING:
+                yield Token(TK_STRING, text[start + 1:m.end() - 1], start, lines)
+            else:
+                self.pos = start
+                if m.group(kind) == '!':
+                    self.error("Expected '=' after '!'")
+                self.error(m.group(kind))
+
+        yield Token('EOF', None, len(text), lines)
+
+
+BYTES_TOKEN_PATTERN = re.compile(rb'''\s*(?:
+    (\d+(?:\.\d*)?)
+  | ([A-Za-z_\x80-\xff][\w\x80-\xff]*)
+  | (==|!=|<=|>=|[-+*/^%,;:=<>{}()])
+  | ("[^"]*")
+  | (\S)
+)''', re.VERBOSE)
+
+BYTES_OPERATORS = {op.encode('ascii'): (kind, op) for op, kind in OPERATORS.items()}
+NON_ASCII_BYTE = re.compile(rb'[\x80-\xff]')
+
+
+# Tokenizes raw bytes (e.g. an mmap of the source file) without ever decoding
+# the whole text; only tokens that contain non-ASCII bytes go through UTF-8.
+# Whitespace and digits are ASCII only here, so run() lexes a source with
+# other characters as text instead (see as_text)
+class BytesLexer(RegexLexer):
+    def __init__(self, data):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        super().__init__(data)
+
+    # the source decoded for RegexLexer if it has non-ASCII characters, else
+    # None; undecodable bytes also give None so that tokens() reports them
+    @staticmethod
+    def as_text(data):
+        if isinstance(data, str):
+            return None if data.isascii() else data
+        if NON_ASCII_BYTE.search(data) is None:
+            return None
+        try:
+            return bytes(data).decode('utf-8')
+        except UnicodeDecodeError:
+            return None
+
+    def decode(self, value, start):
+        try:
+            return value.decode('utf-8')
+        except UnicodeDecodeError as e:
+            self.pos = start + e.start
+            self.error(value[e.start:e.end])
+
+    def name(self, value, start):
+        if value.isascii():
+            return value.decode('ascii').lower()
+        id_str = self.decode(value, start)
+        for i, char in enumerate(id_str):
+            if not (char.isalnum() or char == '_') or (i == 0 and char.isdigit()):
+                self.pos = start + len(id_str[:i].encode('utf-8'))
+                self.error(char)
+        return id_str.lower()
+
+    def tokens(self):
+        data = self.text
+        lines = self.lines
+        intern = sys.intern
+        keyword_kind = KEYWORD_KINDS.get
+
+        for m in BYTES_TOKEN_PATTERN.finditer(data):
+            kind = m.lastindex
+            start = m.start(kind)
+            if kind == PATTERN_NAME:
+                id_str = intern(self.name(m.group(kind), start))
+                yield Token(keyword_kind(id_str, TK_IDENTIFIER), id_str, start, lines)
+            elif kind == PATTERN_OP:
+                kind, value = BYTES_OPERATORS[m.group(kind)]
+                yield Token(kind, value, start, lines)
+            elif kind == PATTERN_NUMBER:
+                value = m.group(kind)
+                if b'.' in value:
+                    yield Token(TK_FLOAT, float(value), start, lines)
+                else:
+                    yield Token(TK_INT, int(value), start, lines)
+            elif kind == PATTERN_STRING:
+                value = data[start + 1:m.end() - 1]
+                if value.isascii():
+                    yield Token(TK_STRING, value.decode('ascii'), start, lines)
+                else:
+                    yield Token(TK_STRING, self.decode(value, start + 1), start, lines)
+            else:
+                self.pos = start
+                value = m.group(kind).decode('ascii')
+                if value == '!':
+                    self.error("Expected '=' after '!'")
+                self.error(value)
+
+        yield Token('EOF', None, len(data), lines)
+
+
+def read_source(path, use_mmap=False):
+    if not use_mmap:
+        return open(path, "r").read()
+    with open(path, 'rb') as f:
+        try:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files cannot be mapped
+            return b''
+
+
+TOKEN_KINDS = [
+    'EOF', TK_INT, TK_FLOAT, TK_STRING, TK_IDENTIFIER, TK_KEYWORD,
+    TK_PLUS, TK_MINUS, TK_MUL, TK_DIV, TK_POW, TK_MOD, TK_EQ,
+    TK_COMMA, TK_SEMICOLON, TK_COLON,
+    TK_OP_NOT_EQUAL, TK_OP_EQUAL_EQUAL, TK_OP_GREATER, TK_OP_GREATER_EQUAL, TK_OP_LESS, TK_OP_LESS_EQUAL,
+    TK_LPAREN, TK_RPAREN, TK_LBRACE, TK_RBRACE,
+]
+KIND_CODES = {kind: code for code, kind in enumerate(TOKEN_KINDS)}
+
+OPERATOR_CODES = {op: KIND_CODES[kind] for op, kind in OPERATORS.items()}
+KEYWORD_CODES = {keyword: KIND_CODES[kind] for keyword, kind in KEYWORD_KINDS.items()}
+
+
+# Struct-of-arrays token store: one byte of kind and two offsets per token,
+# literal values (keyed by start offset) kept only for numbers and strings.
+# Indexing it gives a Token.
+class TokenBuffer:
+    def __init__(self, text):
+        self.text = text
+        self.kinds = array('B')
+        self.starts = array('I')
+        self.ends = array('I')
+        self.values = {}
+        self.lines = LineIndex(text)
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, index):
+        kind = TOKEN_KINDS[self.kinds[index]]
+        if index < 0:
+            index += len(self.kinds)
+        start = self.starts[index]
+        if start in self.values:
+            value = self.values[start]
+        elif kind == 'EOF':
+            value = None
+        else:
+            value = sys.intern(self.text[start:self.ends[index]].lower())
+        return Token(kind, value, start, self.lines)
+
+    def nbytes(self):
+        arrays = (self.kinds, self.starts, self.ends)
+        return sum(sys.getsizeof(a) for a in arrays) + sys.getsizeof(self.values) + sum(
+            sys.getsizeof(v) for v in self.values.values())
+
+
+class CompactLexer(RegexLexer):
+    def get_next_token(self):
+        return self.token_buffer()
+
+    def token_buffer(self, base=0):
+        text = self.text
+        buffer = TokenBuffer(text)
+        kinds = buffer.kinds.append
+        starts = buffer.starts.append
+        ends = buffer.ends.append
+        values = buffer.values
+        code_int = KIND_CODES[TK_INT]
+        code_float = KIND_CODES[TK_FLOAT]
+        code_string = KIND_CODES[TK_STRING]
+        code_identifier = KIND_CODES[TK_IDENTIFIER]
+        keyword_code = KEYWORD_CODES.get
+
+        for m in TOKEN_PATTERN.finditer(text):
+            kind = m.lastindex
+            start, end = m.span(kind)
+            if kind == PATTERN_NAME:
+                kinds(keyword_code(m.group(kind).lower(), code_identifier))
+            elif kind == PATTERN_OP:
+                kinds(OPERATOR_CODES[m.group(kind)])
+            elif kind == PATTERN_NUMBER:
+                value = m.group(kind)
+                if '.' in value:
+                    kinds(code_float)
+                    values[start + base] = float(value)
+                else:
+                    kinds(code_int)
+                    values[start + base] = int(value)
+            elif kind == PATTERN_STRING:
+                kinds(code_string)
+                values[start + base] = text[start + 1:end - 1]
+            else:
+                self.pos = start
+                if m.group(kind) == '!':
+                    self.error("Expected '=' after '!'")
+                self.error(m.group(kind))
+            starts(start + base)
+            ends(end + base)
+
+        kinds(KIND_CODES['EOF'])
+        starts(len(text) + base)
+        ends(len(text) + base)
+        return buffer
+
+
+def split_source(text, parts):
+    # cut only at newlines that are not inside a string literal
+    cuts = [0]
+    quotes = 0
+    for i in range(1, parts):
+        cut = text.find('\n', max(len(text) * i // parts, cuts[-1]))
+        while cut != -1:
+            cut += 1
+            quotes += text.count('"', cuts[-1], cut)
+            if quotes % 2 == 0:
+                cuts.append(cut)
+                break
+            quotes -= text.count('"', cuts[-1], cut)
+            cut = text.find('\n', cut)
+        if cut == -1:
+            break
+    cuts.append(len(text))
+    return cuts
+
+
+def lex_chunk(text, base):
+    try:
+        with redirect_stdout(None):
+            buffer = CompactLexer(text).token_buffer(base)
+    except SystemExit:
+        # reported again, with whole-file positions, by the sequential lexer
+        return None
+    return buffer.kinds, buffer.starts, buffer.ends, buffer.values
+
+
+# Lexes newline-aligned chunks in worker processes and stitches the buffers;
+# the result is the same TokenBuffer CompactLexer builds on its own
+class ParallelLexer(CompactLexer):
+    def __init__(self, text, workers=None, min_chunk=1 << 16):
+        super().__init__(text)
+        self.workers = workers or os.cpu_count() or 1
+        self.min_chunk = min_chunk
+
+    def get_next_token(self):
+        text = self.text
+        parts = min(self.workers, len(text) // self.min_chunk)
+        if parts < 2:
+            return self.token_buffer()
+        cuts = split_source(text, parts)
+
+        with ProcessPoolExecutor(parts) as pool:
+            chunks = list(pool.map(lex_chunk, [text[a:b] for a, b in zip(cuts, cuts[1:])], cuts[:-1]))
+        if None in chunks:
+            return self.token_buffer()
+
+        buffer = TokenBuffer(text)
+        for kinds, starts, ends, values in chunks:
+            buffer.kinds.extend(kinds[:-1])
+            buffer.starts.extend(starts[:-1])
+            buffer.ends.extend(ends[:-1])
+            buffer.values.update(values)
+        buffer.kinds.append(KIND_CODES['EOF'])
+        buffer.starts.append(len(text))
+        buffer.ends.append(len(text))
+        return buffer
+
+
+LEXERS = {
+    'char': Lexer,
+    'regex': RegexLexer,
+    'compact': CompactLexer,
+    'bytes': BytesLexer,
+    'parallel': ParallelLexer,
+}
 
 
 class NumberNode:
     def __init__(self, token):
         self.token = token
         self.value = token.value
-        self.column = token.column
-        self.line = token.line
+
+    @property
+    def line(self):
+        return self.token.line
+
+    @property
+    def column(self):
+        return self.token.column
     
     def __repr__(self):
         return f'{self.token}'
@@ -309,8 +732,14 @@ class NumberNode:
 class VarAccessNode:
     def __init__(self, var_name):
         self.var_name = var_name
-        self.column = var_name.column
-        self.line = var_name.line
+
+    @property
+    def line(self):
+        return self.var_name.line
+
+    @property
+    def column(self):
+        return self.var_name.column
     
     def __repr__(self):
         return f'{self.var_name}'
@@ -319,8 +748,14 @@ class VarAssignNode:
     def __init__(self, var_name, value_node):
         self.var_name = var_name
         self.value = value_node
-        self.column = var_name.column
-        self.line = var_name.line
+
+    @property
+    def line(self):
+        return self.var_name.line
+
+    @property
+    def column(self):
+        return self.var_name.column
     
     def __repr__(self):
         return f'({self.var_name}, {self.value})'
@@ -330,19 +765,41 @@ class BinOpNode:
         self.left = left
         self.op = op
         self.right = right
-        self.column = right.column
-        self.line = left.line
+        self.operation = binary_operation(op)
+
+    @property
+    def line(self):
+        return self.op.line
+
+    @property
+    def column(self):
+        return self.op.column
     
     def __repr__(self):
         return f'({self.left}, {self.op}, {self.right})'
 
 
+# 'and'/'or': the right operand is only evaluated when the left one does not
+# decide the value, which is then int() of the left operand
+class LogicalOpNode(BinOpNode):
+    def __init__(self, left, op, right):
+        super().__init__(left, op, right)
+        # the truth value of the left operand that skips the right one
+        self.skip_when = op.value == 'or'
+
+
 class UnaryOpNode:
     def __init__(self, op, node):
         self.op = op
         self.node = node
-        self.column = node.column
-        self.line = node.line
+
+    @property
+    def line(self):
+        return self.op.line
+
+    @property
+    def column(self):
+        return self.op.column
     
     def __repr__(self):
         return f'({self.op}, {self.node})'
@@ -376,14 +833,82 @@ class WhileNode:
     def __init__(self, condition, body):
         self.condition = condition
         self.body = body
+        self.column = 0
+        self.line = 0
+
+# for var_name = start to end [step step] ... endfor; step is None when omitted
+class ForNode:
+    def __init__(self, var_name, start, end, step, body):
+        self.var_name = var_name
+        self.start = start
+        self.end = end
+        self.step = step
+        self.body = body
+        self.column = 0
+        self.line = 0
+
+# break and continue: statements of a loop body or of an if/switch branch,
+# never parts of an expression. A break leaves the innermost loop or switch,
+# a continue the current iteration of the innermost loop
+class BreakNode:
+    def __init__(self, token):
+        self.token = token
+
+    @property
+    def line(self):
+        return self.token.line
+
+    @property
+    def column(self):
+        return self.token.column
+
+    def __repr__(self):
+        return 'break'
+
+class ContinueNode(BreakNode):
+    def __repr__(self):
+        return 'continue'
+
+
+# Pulls tokens lazily from a lexer generator, buffering only what is peeked
+class TokenStream:
+    def __init__(self, tokens):
+        self.tokens = iter(tokens)
+        self.lookahead = deque()
+
+    def next(self):
+        if self.lookahead:
+            return self.lookahead.popleft()
+        return next(self.tokens, None)
+
+    def peek(self, offset=0):
+        while len(self.lookahead) <= offset:
+            token = next(self.tokens, None)
+            if token is None:
+                return None
+            self.lookahead.append(token)
+        return self.lookahead[offset]
 
 
 class Parser:
     def __init__(self, tokens):
-        self.tokens = tokens
+        if isinstance(tokens, (list, TokenBuffer)):
+            self.tokens = tokens
+            self.stream = None
+            self.size = len(self.tokens)
+            self.current_token = self.tokens[0]
+        else:
+            self.tokens = None
+            self.stream = TokenStream(tokens)
+            self.current_token = self.stream.next()
         self.pos = 0
-        self.size = len(self.tokens)
-        self.current_token = self.tokens[self.pos]
+        # enclosing loops and switches, and the breaks and continues parsed
+        # that have not been matched with one yet
+        self.loops = 0
+        self.switches = 0
+        self.breaks = 0
+        self.continues = 0
+        self.jump = None
 
     def error(self,msg):
         print('Invalid syntax ',msg)
@@ -391,16 +916,25 @@ class Parser:
 
     def advance(self):
         self.pos += 1
-        if self.pos < self.size:
+        if self.stream is not None:
+            self.current_token = self.stream.next()
+        elif self.pos < self.size:
             self.current_token = self.tokens[self.pos]
         else:
             self.current_token = None
 
+    def peek(self):
+        if self.stream is not None:
+            return self.stream.peek()
+        if self.pos + 1 < self.size:
+            return self.tokens[self.pos + 1]
+        return None
+
     def paren_expr(self):
         if not self.current_token.match(TK_LPAREN,'('):
             self.error("Expected '(' at Line: {}, Col: {}".format(self.current_token.line, self.current_token.column+1))
         self.advance()
-        expr = self.expr()
+        expr = self.plain_expr()
         if not self.current_token.match(TK_RPAREN,')'):
             self.error("Expected ')' at Line: {}, Col: {}".format(self.current_token.line, self.current_token.column+1))
         self.advance()
@@ -421,7 +955,7 @@ class Parser:
             self.error("Expected 'then' at Line: {}, Col: {}".format(self.current_token.line, self.current_token.column+1))
         
         self.advance()
-        expr = self.expr()
+        expr = self.statement()
         cases.append((condition,expr))
 
         while self.current_token.match(TK_KEYWORD,'elif'):
@@ -430,12 +964,12 @@ class Parser:
             if not self.current_token.match(TK_KEYWORD,'then'):
                 self.error("Expected 'then' at Line: {}, Col: {}".format(self.current_token.line, self.current_token.column+1))
             self.advance()
-            expr = self.paren_expr()
+            expr = self.statement()
             cases.append((condition,expr))
         
         if self.current_token.match(TK_KEYWORD,'else'):
             self.advance()
-            else_case = self.expr()
+            else_case = self.statement()
         
         if not self.current_token.match(TK_KEYWORD,'endif'):
             self.error("Expected 'endif' at Line: {}, Col: {} {}".format(self.current_token.line, self.current_token.column+1,self.current_token))
@@ -453,15 +987,18 @@ class Parser:
         if not self.current_token.match(TK_KEYWORD, 'switch'):
             self.error("Expected 'switch' at Line: {}, Col: {}".format(self.current_token.line, self.current_token.column+1))
         self.advance()
-        switch_condition = self.expr()
+        switch_condition = self.plain_expr()
 
+        # the switch owns the breaks of its branches; continues pass through
+        breaks = self.breaks
+        self.switches += 1
         while self.current_token.match(TK_KEYWORD, 'case'):
             self.advance()
-            condition = self.expr()
+            condition = self.plain_expr()
             if not self.current_token.match(TK_COLON, ':'):
                 self.error("Expected ':' at Line: {}, Col: {}".format(self.current_token.line, self.current_token.column+1))
             self.advance()
-            expr = self.expr()
+            expr = self.statement()
             cases.append((condition, expr))
 
         if self.current_token.match(TK_KEYWORD, 'default'):
@@ -469,11 +1006,13 @@ class Parser:
             if not self.current_token.match(TK_COLON, ':'):
                 self.error("Expected ':' at Line: {}, Col: {}".format(self.current_token.line, self.current_token.column+1))
             self.advance()
-            default_case = self.expr()
+            default_case = self.statement()
 
         if not self.current_token.match(TK_KEYWORD, 'endswitch'):
             self.error("Expected 'endswitch' at Line: {}, Col: {}".format(self.current_token.line, self.current_token.column+1))
         self.advance()
+        self.switches -= 1
+        self.breaks = breaks
         return SwitchNode(switch_condition, cases, default_case)
 
 
@@ -489,15 +1028,92 @@ class Parser:
 
         self.advance()
     
-        body = []
-        while not self.current_token.match(TK_KEYWORD, 'endwhile'):
-            body.append(self.expr())
+        body = self.loop_body('endwhile')
         
         if not self.current_token.match(TK_KEYWORD, 'endwhile'):
             self.error("Expected 'endwhile' at Line: {}, Col: {}".format(self.current_token.line, self.current_token.column+1))
         self.advance()
 
         return WhileNode(condition, body)
+
+    def for_expr(self):
+        if not self.current_token.match(TK_KEYWORD,'for'):
+            self.error("Expected 'for' at Line: {}, Col: {}".format(self.current_token.line, self.current_token.column+1))
+        self.advance()
+        if self.current_token.type != TK_IDENTIFIER:
+            self.error("Expected Identifier at Line: {}, Col: {}".format(self.current_token.line, self.current_token.column+1))
+        var_name = self.current_token
+        self.advance()
+        if self.current_token.type != TK_EQ:
+            self.error("Expected '=' at Line: {}, Col: {}".format(self.current_token.line, self.current_token.column+1))
+        self.advance()
+        start = self.plain_expr()
+
+        if not self.current_token.match(TK_KEYWORD,'to'):
+            self.error("Expected 'to' at Line: {}, Col: {}".format(self.current_token.line, self.current_token.column+1))
+        self.advance()
+        end = self.plain_expr()
+
+        step = None
+        if self.current_token.match(TK_KEYWORD,'step'):
+            self.advance()
+            step = self.plain_expr()
+
+        body = self.loop_body('endfor')
+        self.advance()
+
+        return ForNode(var_name, start, end, step, body)
+
+    # the statements up to the end keyword; the loop owns their breaks and continues
+    def loop_body(self, end):
+        breaks, continues = self.breaks, self.continues
+        self.loops += 1
+        body = []
+        while not self.current_token.match(TK_KEYWORD, end):
+            body.append(self.statement())
+        self.loops -= 1
+        self.breaks, self.continues = breaks, continues
+        return body
+
+    # A loop body statement or an if/switch branch: the only places a break
+    # or continue may stand. Anything that holds one, then, has to be an
+    # if or switch statement, not the operand of an expression around it
+    def statement(self):
+        token = self.current_token
+        if token.match(TK_KEYWORD, 'break') or token.match(TK_KEYWORD, 'continue'):
+            return self.jump_statement()
+        jumps = self.breaks + self.continues
+        node = self.expr()
+        if self.breaks + self.continues != jumps and type(node) is not IfNode and type(node) is not SwitchNode:
+            self.jump_error()
+        return node
+
+    # an expression that must not hold a break or continue, such as a condition
+    def plain_expr(self):
+        jumps = self.breaks + self.continues
+        node = self.expr()
+        if self.breaks + self.continues != jumps:
+            self.jump_error()
+        return node
+
+    def jump_statement(self):
+        token = self.current_token
+        if token.value == 'break':
+            if not self.loops and not self.switches:
+                self.error("'break' outside a loop or switch at Line: {}, Col: {}".format(token.line, token.column+1))
+            self.breaks += 1
+            node = BreakNode(token)
+        else:
+            if not self.loops:
+                self.error("'continue' outside a loop at Line: {}, Col: {}".format(token.line, token.column+1))
+            self.continues += 1
+            node = ContinueNode(token)
+        self.advance()
+        self.jump = token
+        return node
+
+    def jump_error(self):
+        self.error("'{}' inside an expression at Line: {}, Col: {}".format(self.jump.value, self.jump.line, self.jump.column+1))
     
 
     
@@ -526,6 +1142,12 @@ class Parser:
             return self.switch_expr()
         elif token.match(TK_KEYWORD,'while'):
             return self.while_expr()
+        elif token.match(TK_KEYWORD,'for'):
+            return self.for_expr()
+        elif token.match(TK_KEYWORD,'break') or token.match(TK_KEYWORD,'continue'):
+            # one that starts a statement never gets here
+            self.jump_statement()
+            self.jump_error()
 
         self.error(f"(atom) Expected: \n  var, int, float, '(', or operator at Line: {token.line} Col :{token.column+1} Get: {token}")
     
@@ -612,18 +1234,17 @@ class Parser:
             node = self.expr()
             return VarAssignNode(var_name, node)
 
-        if self.current_token.type == TK_IDENTIFIER:
+        if self.current_token.type == TK_IDENTIFIER and self.peek().type == TK_EQ:
             var_name = self.current_token
             self.advance()
-            if self.current_token.type == TK_EQ:
-                self.advance()
-                node = self.expr()
-                return VarAssignNode(var_name, node)
-            else:
-                return VarAccessNode(var_name)
-            
-        node = self.bin_op(self.comp_expr, ((TK_KEYWORD, 'and'), (TK_KEYWORD, 'or')))        
-        return node
+            self.advance()
+            node = self.expr()
+            return VarAssignNode(var_name, node)
+
+        return self.expression()
+
+    def expression(self):
+        return self.bin_op(self.comp_expr, ((TK_KEYWORD, 'and'), (TK_KEYWORD, 'or')))
     
     def statements(self):
         results = []
@@ -654,15 +1275,296 @@ class Parser:
             token = self.current_token
             self.advance()
             right = func_b()
-            left = BinOpNode(left, token, right)
+            left = (LogicalOpNode if token.type == TK_KEYWORD else BinOpNode)(left, token, right)
         return left    
 
 
+# One top-level statement of an IncrementalParser document. Its tokens hold
+# offsets relative to the chunk, so an edit before it only moves chunk.start.
+class Chunk:
+    def __init__(self, document, start, tokens, node):
+        self.document = document
+        self.start = start
+        self.tokens = tokens
+        self.node = node
+        for token in tokens:
+            token.pos -= start
+            token.lines = self
+
+    def position(self, offset):
+        return self.document.lines.position(self.start + offset)
+
+
+# Keeps the tokens and AST of every top-level statement; after an edit only
+# the statements around it are re-lexed and re-parsed, until the new token
+# stream lines up with the start of an untouched statement again
+class IncrementalParser:
+    def __init__(self, text):
+        self.text = text
+        self.lines = LineIndex(text)
+        self.chunks = []
+        self.reparsed = 0
+        self.lexed = 0
+        self.reparse(0, 0, 0)
+
+    def parse(self):
+        return ListNode([chunk.node for chunk in self.chunks])
+
+    def edit(self, start, end, new_text):
+        self.text = self.text[:start] + new_text + self.text[end:]
+        self.lines = LineIndex(self.text)
+        delta = len(new_text) - (end - start)
+
+        # start one statement early: the edit may extend the previous one
+        first = max(bisect_right(self.chunks, start, key=lambda c: c.start) - 2, 0)
+        reuse = bisect_right(self.chunks, end - 1, key=lambda c: c.start)
+        for chunk in self.chunks[reuse:]:
+            chunk.start += delta
+        offset = self.chunks[first].start if first < len(self.chunks) else 0
+        self.reparse(first, reuse, offset, start + len(new_text))
+
+    def reparse(self, first, reuse, offset, edit_end=0):
+        recorded = []
+
+        def record(tokens):
+            for token in tokens:
+                recorded.append(token)
+                yield token
+
+        lexer = RegexLexer(self.text)
+        lexer.lines = self.lines
+        parser = Parser(record(lexer.tokens(offset)))
+        chunks = []
+        while parser.current_token.type != 'EOF':
+            pos = parser.current_token.pos
+            while reuse < len(self.chunks) and self.chunks[reuse].start < pos:
+                reuse += 1
+            if reuse < len(self.chunks) and self.chunks[reuse].start == pos and pos >= edit_end:
+                break
+            begin = parser.pos
+            node = parser.expr()
+            chunks.append(Chunk(self, pos, recorded[begin:parser.pos], node))
+        else:
+            reuse = len(self.chunks)
+
+        self.chunks[first:reuse] = chunks
+        self.reparsed = len(chunks)
+        self.lexed = len(recorded)
+
+
+LOGIC_BINDING_POWER = 10
+COMPARISON_BINDING_POWER = 20
+UNARY_BINDING_POWER = 50
+
+BINDING_POWER = {
+    TK_OP_EQUAL_EQUAL: COMPARISON_BINDING_POWER,
+    TK_OP_NOT_EQUAL: COMPARISON_BINDING_POWER,
+    TK_OP_GREATER: COMPARISON_BINDING_POWER,
+    TK_OP_GREATER_EQUAL: COMPARISON_BINDING_POWER,
+    TK_OP_LESS: COMPARISON_BINDING_POWER,
+    TK_OP_LESS_EQUAL: COMPARISON_BINDING_POWER,
+    TK_PLUS: 30,
+    TK_MINUS: 30,
+    TK_MOD: 30,
+    TK_MUL: 40,
+    TK_DIV: 40,
+    TK_POW: 60,
+}
+
+KEYWORD_BINDING_POWER = {
+    'and': LOGIC_BINDING_POWER,
+    'or': LOGIC_BINDING_POWER,
+}
+
+# keywords look up KEYWORD_BINDING_POWER by value
+INFIX_BINDING_POWER = dict(BINDING_POWER)
+INFIX_BINDING_POWER[TK_KEYWORD] = -1
+
+
+# Precedence climbing over BINDING_POWER (^ is right associative); builds the
+# same trees as the expr -> comp_expr -> arith_expr -> term -> factor -> power chain
+class PrattParser(Parser):
+    def expression(self):
+        return self.parse_expression(0)
+
+    def parse_expression(self, min_bp):
+        return self.parse_infix(self.parse_prefix(min_bp), min_bp)
+
+    def parse_prefix(self, min_bp):
+        token = self.current_token
+        type = token.type
+        if type == TK_INT or type == TK_FLOAT:
+            self.advance()
+            return NumberNode(token)
+        if type == TK_IDENTIFIER:
+            self.advance()
+            return VarAccessNode(token)
+        if type == TK_MINUS or type == TK_PLUS:
+            self.advance()
+            return UnaryOpNode(token, self.parse_expression(UNARY_BINDING_POWER))
+        if min_bp < COMPARISON_BINDING_POWER and token.match(TK_KEYWORD, 'not'):
+            self.advance()
+            return UnaryOpNode(token, self.parse_expression(LOGIC_BINDING_POWER))
+        return self.atom()
+
+    def parse_infix(self, left, min_bp):
+        binding_power = INFIX_BINDING_POWER.get
+        keyword_binding_power = KEYWORD_BINDING_POWER.get
+        while True:
+            token = self.current_token
+            bp = binding_power(token.type, 0)
+            if bp < 0:
+                bp = keyword_binding_power(token.value, 0)
+            if bp <= min_bp:
+                return left
+            self.advance()
+            if token.type == TK_POW:
+                bp -= 1
+
+            # leaf operands are built inline; recurse only if the next
+            # operator binds tighter than this one
+            operand = self.current_token
+            type = operand.type
+            if type == TK_INT or type == TK_FLOAT:
+                self.advance()
+                right = NumberNode(operand)
+            elif type == TK_IDENTIFIER:
+                self.advance()
+                right = VarAccessNode(operand)
+            else:
+                right = self.parse_prefix(bp)
+            next_bp = binding_power(self.current_token.type, 0)
+            if next_bp < 0:
+                next_bp = keyword_binding_power(self.current_token.value, 0)
+            if next_bp > bp:
+                right = self.parse_infix(right, bp)
+            left = (LogicalOpNode if token.type == TK_KEYWORD else BinOpNode)(left, token, right)
+
+
+# frames of the StackParser machine
+FRAME_BINARY = 0
+FRAME_UNARY = 1
+FRAME_PAREN = 2
+FRAME_ASSIGN = 3
+FRAME_LOGICAL = 4     # StackInterpreter: the left operand of an and/or is ready
+
+
+# PrattParser with the call stack made explicit: pending operators, unary
+# prefixes, '(' and assignments are frames on a list, so nesting depth is
+# bounded by memory instead of the recursion limit. if/switch/while bodies
+# still go through atom() and recurse once per nested block
+class StackParser(PrattParser):
+    def expr(self):
+        binding_power = INFIX_BINDING_POWER.get
+        keyword_binding_power = KEYWORD_BINDING_POWER.get
+        frames = []
+        push = frames.append
+        pop = frames.pop
+        min_bp = 0
+        node = None
+        # expr() start: assignments, then the expression itself
+        start = True
+        while True:
+            if start:
+                token = self.current_token
+                if token.match(TK_KEYWORD, 'exit'):
+                    return Parser.expr(self)
+                if token.match(TK_KEYWORD, 'var'):
+                    self.advance()
+                    if self.current_token.type != TK_IDENTIFIER:
+                        self.error("Expected Identifier at Line: {}, Col: {}".format(self.current_token.line, self.current_token.column+1))
+                    var_name = self.current_token
+                    self.advance()
+                    if self.current_token.type != TK_EQ:
+                        self.error("Expected '=' at Line: {}, Col: {}".format(self.current_token.line, self.current_token.column+1))
+                    self.advance()
+                    push((FRAME_ASSIGN, var_name, 0))
+                    continue
+                if token.type == TK_IDENTIFIER and self.peek().type == TK_EQ:
+                    self.advance()
+                    self.advance()
+                    push((FRAME_ASSIGN, token, 0))
+                    continue
+                start = False
+                min_bp = 0
+
+            if node is None:
+                # prefix position: read one operand or open a frame
+                token = self.current_token
+                type = token.type
+                if type == TK_INT or type == TK_FLOAT:
+                    self.advance()
+                    node = NumberNode(token)
+                elif type == TK_IDENTIFIER:
+                    self.advance()
+                    node = VarAccessNode(token)
+                elif type == TK_MINUS or type == TK_PLUS:
+                    self.advance()
+                    push((FRAME_UNARY, token, min_bp))
+                    min_bp = UNARY_BINDING_POWER
+                    continue
+                elif min_bp < COMPARISON_BINDING_POWER and token.match(TK_KEYWORD, 'not'):
+                    self.advance()
+                    push((FRAME_UNARY, token, min_bp))
+                    min_bp = LOGIC_BINDING_POWER
+                    continue
+                elif type == TK_LPAREN:
+                    self.advance()
+                    push((FRAME_PAREN, token, min_bp))
+                    start = True
+                    continue
+                else:
+                    node = self.atom()
+
+            # infix position: extend node or close the innermost frame
+            token = self.current_token
+            bp = binding_power(token.type, 0)
+            if bp < 0:
+                bp = keyword_binding_power(token.value, 0)
+            if bp > min_bp:
+                self.advance()
+                if token.type == TK_POW:
+                    bp -= 1
+                push((FRAME_BINARY, (node, token), min_bp))
+                min_bp = bp
+                node = None
+                continue
+
+            if not frames:
+                return node
+            kind, value, min_bp = pop()
+            if kind == FRAME_BINARY:
+                token = value[1]
+                node = (LogicalOpNode if token.type == TK_KEYWORD else BinOpNode)(value[0], token, node)
+            elif kind == FRAME_UNARY:
+                node = UnaryOpNode(value, node)
+            elif kind == FRAME_PAREN:
+                if self.current_token.type != TK_RPAREN:
+                    self.error("(factor) Expected ')' at Line: {}, Col: {}".format(self.current_token.line, self.current_token.column+1))
+                self.advance()
+            else:
+                node = VarAssignNode(value, node)
+
+
+PARSERS = {
+    'recursive': Parser,
+    'pratt': PrattParser,
+    'stack': StackParser,
+}
+
+
 class Number:
-    def __init__(self, value, line=None, column=None):
+    def __init__(self, value, token=None):
         self.value = value
-        self.line = line
-        self.column = column
+        self.token = token
+
+    @property
+    def line(self):
+        return self.token.line if self.token is not None else None
+
+    @property
+    def column(self):
+        return self.token.column if self.token is not None else None
     
     def __repr__(self):
         return f'{self.value}'
@@ -752,6 +1654,33 @@ class Number:
 
 
 
+def no_operation(left, right):
+    return None
+
+
+# Number methods of the binary operators, keyed by token type; keywords by value
+BINARY_OPERATIONS = {
+    TK_PLUS: Number.add,
+    TK_MINUS: Number.sub,
+    TK_MUL: Number.mul,
+    TK_DIV: Number.div,
+    TK_POW: Number.powed,
+    TK_MOD: Number.mod,
+    TK_OP_GREATER: Number.comp_gt,
+    TK_OP_GREATER_EQUAL: Number.comp_gte,
+    TK_OP_LESS: Number.comp_lt,
+    TK_OP_LESS_EQUAL: Number.comp_lte,
+    TK_OP_EQUAL_EQUAL: Number.comp_eq,
+    TK_OP_NOT_EQUAL: Number.comp_neq,
+    'and': Number.anded,
+    'or': Number.ored,
+}
+
+
+def binary_operation(op):
+    return BINARY_OPERATIONS.get(op.value if op.type == TK_KEYWORD else op.type, no_operation)
+
+
 class Context:
     def __init__(self, display_name, parent=None, parent_entry_pos=None):
         self.display_name = display_name
@@ -760,10 +1689,22 @@ class Context:
         self.symbol_table = None
 
 
+SHAPE_STAMPS = itertools.count()
+
+
+# An Environment's shape stamp changes whenever a name is added to or removed
+# from it or from a scope above it, the only changes that can move the scope
+# a name resolves to; assigning a name that is already there keeps it, so
+# inline caches stay valid. Stamps come from one counter, so an inline cache
+# can keep the stamp it was filled under instead of the environment
 class Environment:
     def __init__(self, parent=None):
         self.vars = {}
         self.parent = parent
+        self.shape = next(SHAPE_STAMPS)
+        self.children = weakref.WeakSet()
+        if parent is not None:
+            parent.children.add(self)
     
     def __repr__(self):
         return f'{self.vars}'
@@ -777,49 +1718,194 @@ class Environment:
             print(f"Undefined variable '{var_name}'")
             exit(1)
     
+    # the innermost scope that has var_name, or None
+    def find(self, var_name):
+        environment = self
+        while environment is not None:
+            if var_name in environment.vars:
+                return environment
+            environment = environment.parent
+        return None
+
     def set(self, var_name, value):
+        if var_name not in self.vars:
+            self.reshape()
         self.vars[var_name] = value
 
     def remove(self, var_name):
         del self.vars[var_name]
+        self.reshape()
 
+    def reshape(self):
+        work = [self]
+        while work:
+            environment = work.pop()
+            environment.shape = next(SHAPE_STAMPS)
+            work.extend(environment.children)
 
-class Interpreter:
-    def __init__(self, parser, context):
-        self.parser = parser
-        self.context = context
-    
-    def visit(self, node):
-        method_name = f'visit_{type(node).__name__}'
-        method = getattr(self, method_name)
-        return method(node)
-    
-    def visit_VarAssignNode(self, node):
-        var_name = node.var_name.value
-        value = self.visit(node.value)
 
-        if value == None:
-            print(f"Undefined variable '{var_name}'")
-            exit(1)
+# visit_<NodeClass> methods of one interpreter, looked up by name only the
+# first time each node class is seen
+class VisitorTable(dict):
+    def __init__(self, interpreter):
+        super().__init__()
+        self.interpreter = interpreter
 
-        self.context.symbol_table.set(var_name, value)
+    def __missing__(self, node_class):
+        method = self[node_class] = getattr(self.interpreter, f'visit_{node_class.__name__}')
+        return method
 
-  
 
-        return value
-    
-    def visit_VarAccessNode(self, node):
+# The values a for loop's counter takes, from start through end: a range for
+# int bounds and step, otherwise start + k * step while it is within end. The
+# bounds are evaluated once, and assigning the counter in the body does not
+# change the values that follow
+def for_range(start, end, step):
+    if type(start) is int and type(end) is int and type(step) is int:
+        return range(start, end + 1 if step > 0 else end - 1, step)
+    return counted_range(start, end, step)
+
+
+def counted_range(start, end, step):
+    count = 0
+    value = start
+    while value <= end if step > 0 else value >= end:
+        yield value
+        count += 1
+        value = start + count * step
+
+
+# whether a for loop from start through end sets its counter at all
+def for_runs(start, end, step):
+    return start <= end if step > 0 else start >= end
+
+
+def zero_step(node):
+    print(f"Step cannot be zero At Line: {node.line} : Column: {node.column} "  )
+    exit(1)
+
+
+# The values of a break and a continue. An if or switch holding one as a
+# branch passes it on as its own value, up to the loop body statement or
+# the switch that owns it, so only those check for them
+class Jump:
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return self.name
+
+
+BREAK = Jump('break')
+CONTINUE = Jump('continue')
+
+
+# whether node may evaluate to the Jump of one of kinds: it is a break or
+# continue, or an if/switch with a branch that may. A switch keeps its breaks
+def may_jump(node, kinds=(BreakNode, ContinueNode)):
+    kind = type(node)
+    if kind in kinds:
+        return True
+    if kind is IfNode:
+        branches = [expr for _, expr in node.cases]
+        if node.else_case:
+            branches.append(node.else_case)
+    elif kind is SwitchNode:
+        branches = [expr for _, expr in node.cases]
+        if node.default_case != None:
+            branches.append(node.default_case)
+        kinds = tuple(jump for jump in kinds if jump is not BreakNode)
+    else:
+        return False
+    return any(may_jump(branch, kinds) for branch in branches)
+
+
+# the break or continue of a loop body statement `if (c) then break endif`,
+# which the compilers turn into a plain test of c; None for other nodes
+def guard_jump(node):
+    if type(node) is IfNode and len(node.cases) == 1 and not node.else_case:
+        jump = node.cases[0][1]
+        if type(jump) is BreakNode or type(jump) is ContinueNode:
+            return jump
+    return None
+
+
+# The tree walker tests a condition with Number.is_true, so a condition whose
+# value is None (an if without else that took no branch, a switch that matched
+# nothing, a loop) stops the program with this error. The engines on plain
+# values raise the same one where None != 0 would take it as true
+def none_condition():
+    raise AttributeError("'NoneType' object has no attribute 'is_true'")
+
+
+COMPARISON_OPERATIONS = {
+    Number.comp_gt, Number.comp_gte, Number.comp_lt, Number.comp_lte, Number.comp_eq, Number.comp_neq,
+}
+
+
+# whether the unboxed value of node is always an int or None, so the native
+# engines need not int() it as the right operand of an and/or
+def yields_int(node):
+    kind = type(node)
+    if kind is LogicalOpNode:
+        return True
+    if kind is BinOpNode:
+        return node.operation in COMPARISON_OPERATIONS
+    return kind is NumberNode and type(node.value) is int
+
+
+class Interpreter:
+    def __init__(self, parser, context):
+        self.parser = parser
+        self.context = context
+        self.visitors = VisitorTable(self)
+        # inline caches of visit_VarAccessNode by node: (shape stamp of the
+        # environment read from, vars of the scope holding the name)
+        self.caches = {}
+    
+    def visit(self, node):
+        return self.visitors[type(node)](node)
+    
+    def visit_VarAssignNode(self, node):
         var_name = node.var_name.value
-        value = self.context.symbol_table.get(var_name)
+        value = self.visit(node.value)
+        return self.assign(var_name, value)
 
+    def assign(self, var_name, value):
         if value == None:
             print(f"Undefined variable '{var_name}'")
             exit(1)
+
+        self.context.symbol_table.set(var_name, value)
+
+  
+
         return value
+    
+    def visit_VarAccessNode(self, node):
+        environment = self.context.symbol_table
+        try:
+            shape, scope_vars = self.caches[node]
+            if shape == environment.shape:
+                return scope_vars[node.var_name.value]
+        except KeyError:
+            pass
+        scope_vars = self.resolve_var(node.var_name.value, environment)
+        self.caches[node] = (environment.shape, scope_vars)
+        return scope_vars[node.var_name.value]
+
+    # the vars of the scope holding var_name, for an inline cache to keep
+    def resolve_var(self, var_name, environment):
+        scope = environment.find(var_name)
+        # identity, as Number.__eq__ would be called for every read otherwise
+        if scope is None or scope.vars[var_name] is None:
+            print(f"Undefined variable '{var_name}'")
+            exit(1)
+        return scope.vars
 
     def visit_NumberNode(self, node):
         #print("visit_NumberNode")
-        return Number(node.value, node.line, node.column)
+        return Number(node.value, node.token)
     
     def visit_ListNode(self, node):
         exp=[]
@@ -831,47 +1917,28 @@ class Interpreter:
         #print("visit_BinOpNode")
         left = self.visit(node.left)
         right = self.visit(node.right)
+        return node.operation(left, right)
 
-        if node.op.type == TK_PLUS:
-            return left.add(right)
-        elif node.op.type == TK_MINUS:
-            return left.sub(right)
-        elif node.op.type == TK_MUL:
-            return left.mul(right)
-        elif node.op.type == TK_DIV:
-            return left.div(right)
-        elif node.op.type == TK_POW:
-            return left.powed(right)
-        elif node.op.type == TK_MOD:
-            return left.mod(right)
-        elif node.op.type == TK_OP_GREATER:
-            return left.comp_gt(right)
-        elif node.op.type == TK_OP_GREATER_EQUAL:
-            return left.comp_gte(right)
-        elif node.op.type == TK_OP_LESS:
-            return left.comp_lt(right)
-        elif node.op.type == TK_OP_LESS_EQUAL:
-            return left.comp_lte(right)
-        elif node.op.type == TK_OP_EQUAL_EQUAL:
-            return left.comp_eq(right)
-        elif node.op.type == TK_OP_NOT_EQUAL:
-            return left.comp_neq(right)
-        elif node.op.match(TK_KEYWORD, "and"):
-            return left.anded(right)
-        elif node.op.match(TK_KEYWORD, "or"):
-            return left.ored(right)
-        else:
-            return None
+    def visit_LogicalOpNode(self, node):
+        left = self.visit(node.left)
+        if left.is_true() is node.skip_when:
+            return Number(int(left.value))
+        return node.operation(left, self.visit(node.right))
+
+    def binary_op(self, op, left, right):
+        return binary_operation(op)(left, right)
 
     
     def visit_UnaryOpNode(self, node):
         #print("visit_UnaryOpNode")
         number = self.visit(node.node)
-       
-        if node.op.type == TK_MINUS:
-            number = number.mul(Number(-1, node.line, node.column)) 
+        return self.unary_op(node.op, number)
+
+    def unary_op(self, op, number):
+        if op.type == TK_MINUS:
+            number = number.mul(Number(-1, op)) 
 
-        elif node.op.match(TK_KEYWORD, "not"):
+        elif op.match(TK_KEYWORD, "not"):
             if number.value == 0:
                 number = number.notted()
         return number 
@@ -888,48 +1955,3279 @@ class Interpreter:
         
         return None
 
+    # a break in a branch ends the switch with the value None
     def visit_SwitchNode(self, node):
         switch_value = self.visit(node.condition)
         for condition, expr in node.cases:
                 condition_value = self.visit(condition)
                 if condition_value == switch_value:
-                    return self.visit(expr)
+                    value = self.visit(expr)
+                    return None if value is BREAK else value
         if node.default_case != None:
-            return self.visit(node.default_case)
+            value = self.visit(node.default_case)
+            return None if value is BREAK else value
         return None        
 
+    # A loop's value is None. The visitors of the condition and the body
+    # statements are looked up once, not per iteration, and the statements'
+    # values are dropped as they come instead of being collected; they are
+    # only checked for a BREAK or CONTINUE when the body has a jump at all
+    def visit_WhileNode(self, node):
+        condition = node.condition
+        test = self.visitors[type(condition)]
+        body = [(self.visitors[type(child)], child) for child in node.body]
+        if not any(may_jump(child) for child in node.body):
+            while test(condition).is_true():
+                for visit, child in body:
+                    visit(child)
+            return None
+        while test(condition).is_true():
+            for visit, child in body:
+                value = visit(child)
+                if value is BREAK:
+                    return None
+                if value is CONTINUE:
+                    break
+        return None
+
+    # the counter is a fresh Number per iteration, as an assignment would make
+    def visit_ForNode(self, node):
+        start = self.visit(node.start).value
+        end = self.visit(node.end).value
+        step = 1
+        if node.step is not None:
+            step = self.visit(node.step).value
+            if step == 0:
+                zero_step(node.step)
+        var_name = node.var_name.value
+        symbol_table = self.context.symbol_table
+        body = [(self.visitors[type(child)], child) for child in node.body]
+        if not any(may_jump(child) for child in node.body):
+            for value in for_range(start, end, step):
+                symbol_table.set(var_name, Number(value))
+                for visit, child in body:
+                    visit(child)
+            return None
+        for value in for_range(start, end, step):
+            symbol_table.set(var_name, Number(value))
+            for visit, child in body:
+                jump = visit(child)
+                if jump is BREAK:
+                    return None
+                if jump is CONTINUE:
+                    break
+        return None
+
+    def visit_BreakNode(self, node):
+        return BREAK
+
+    def visit_ContinueNode(self, node):
+        return CONTINUE
 
+
+    # the inline caches last one run, so they never keep the scopes of an
+    # earlier one alive through a tree that is run again
     def interpret(self):
         tree = self.parser.parse()
+        self.caches = {}
         return self.visit(tree)
 
 
+# Evaluates expression trees with an explicit work list instead of recursion:
+# children are pushed right to left so they still run left to right, and a
+# (marker, node) pair applies the operator once its operands are on values.
+# Control nodes go through Interpreter, whose visits come back here
+class StackInterpreter(Interpreter):
+    def visit(self, node):
+        if type(node) not in STACK_NODES:
+            return Interpreter.visit(self, node)
+        values = []
+        work = [node]
+        push = work.append
+        while work:
+            node = work.pop()
+            kind = type(node)
+            if kind is tuple:
+                marker, node = node
+                if marker == FRAME_BINARY:
+                    right = values.pop()
+                    values[-1] = node.operation(values[-1], right)
+                elif marker == FRAME_UNARY:
+                    values[-1] = self.unary_op(node.op, values[-1])
+                elif marker == FRAME_LOGICAL:
+                    left = values[-1]
+                    if left.is_true() is node.skip_when:
+                        values[-1] = Number(int(left.value))
+                    else:
+                        push((FRAME_BINARY, node))
+                        push(node.right)
+                else:
+                    values[-1] = self.assign(node.var_name.value, values[-1])
+            elif kind is NumberNode:
+                values.append(Number(node.value, node.token))
+            elif kind is VarAccessNode:
+                values.append(self.visit_VarAccessNode(node))
+            elif kind is BinOpNode:
+                push((FRAME_BINARY, node))
+                push(node.right)
+                push(node.left)
+            elif kind is LogicalOpNode:
+                push((FRAME_LOGICAL, node))
+                push(node.left)
+            elif kind is UnaryOpNode:
+                push((FRAME_UNARY, node))
+                push(node.node)
+            elif kind is VarAssignNode:
+                push((FRAME_ASSIGN, node))
+                push(node.value)
+            else:
+                values.append(Interpreter.visit(self, node))
+        return values[0]
+
 
-global_symbol_table = Environment()
-global_symbol_table.set("nil", Number(0))
-global_symbol_table.set("true", Number(1))
-global_symbol_table.set("false", Number(0))
+STACK_NODES = (NumberNode, VarAccessNode, BinOpNode, LogicalOpNode, UnaryOpNode, VarAssignNode)
 
 
+FLAT_NUMBER = 0
+FLAT_VAR_ACCESS = 1
+FLAT_VAR_ASSIGN = 2
+FLAT_BINARY = 3
+FLAT_UNARY = 4
+FLAT_LIST = 5
+FLAT_IF = 6
+FLAT_SWITCH = 7
+FLAT_WHILE = 8
+FLAT_FOR = 9
+FLAT_BREAK = 10
+FLAT_CONTINUE = 11
+FLAT_LOGICAL = 12
 
-def run(text):
-    lexer = Lexer(text)
-    tokens = lexer.get_next_token()
-    parser = Parser(tokens)
-    
-    context = Context('<program>')
-    context.symbol_table = global_symbol_table
+FLAT_FORMAT_VERSION = 2
 
+# operator codes of FLAT_BINARY/FLAT_UNARY/FLAT_LOGICAL nodes; keywords are coded by value
+FLAT_OPERATORS = [
+    TK_PLUS, TK_MINUS, TK_MUL, TK_DIV, TK_POW, TK_MOD,
+    TK_OP_EQUAL_EQUAL, TK_OP_NOT_EQUAL, TK_OP_GREATER, TK_OP_GREATER_EQUAL, TK_OP_LESS, TK_OP_LESS_EQUAL,
+    'and', 'or', 'not',
+]
+FLAT_OPERATOR_CODES = {op: code for code, op in enumerate(FLAT_OPERATORS)}
+FLAT_OPERATOR_TOKENS = [Token(TK_KEYWORD, op, 0) if op in KEYWORD_KINDS else Token(op, op, 0) for op in FLAT_OPERATORS]
+FLAT_OPERATIONS = [binary_operation(token) for token in FLAT_OPERATOR_TOKENS]
 
-    interpreter = Interpreter(parser, context)
-    re = interpreter.interpret()
-    return re
+
+def node_children(node):
+    kind = type(node)
+    if kind is BinOpNode or kind is LogicalOpNode:
+        return [node.left, node.right]
+    if kind is UnaryOpNode:
+        return [node.node]
+    if kind is VarAssignNode:
+        return [node.value]
+    if kind is ListNode:
+        return node.node_list
+    if kind is IfNode:
+        children = [child for case in node.cases for child in case]
+        if node.else_case:
+            children.append(node.else_case)
+        return children
+    if kind is SwitchNode:
+        children = [node.condition] + [child for case in node.cases for child in case]
+        if node.default_case != None:
+            children.append(node.default_case)
+        return children
+    if kind is WhileNode:
+        return [node.condition] + node.body
+    if kind is ForNode:
+        bounds = [node.start, node.end] if node.step is None else [node.start, node.end, node.step]
+        return bounds + node.body
+    return []
+
+
+# The AST as parallel arrays indexed by node: kind, three operand fields and
+# the source offset, with literals and names in a constants pool. Children
+# come before their parents and the root is the last node. Operand fields:
+#   NUMBER, VAR_ACCESS  c = constant
+#   VAR_ASSIGN          a = value, c = name constant
+#   BINARY, UNARY       a = left/operand, b = right, c = operator code
+#   LOGICAL             like BINARY, for 'and'/'or'
+#   LIST                a, b = start and count in children
+#   IF                  a, b = start of (condition, expr) pairs in children and
+#                       their count, c = else node or -1
+#   SWITCH              like IF, with the switch condition before the pairs
+#   WHILE               a, b = start of condition then body in children, body count
+#   FOR                 a, b = start of start, end, step (-1 if omitted) then
+#                       body in children, body count, c = counter name constant
+#   BREAK, CONTINUE     no operands
+class FlatAST:
+    def __init__(self):
+        self.kinds = array('B')
+        self.a = array('i')
+        self.b = array('i')
+        self.c = array('i')
+        self.offsets = array('I')
+        self.children = array('i')
+        self.constants = []
+        self.constant_index = {}
+        self.lines = None
+
+    def __len__(self):
+        return len(self.kinds)
+
+    @property
+    def root(self):
+        return len(self.kinds) - 1
+
+    def constant(self, value):
+        key = (type(value), value)
+        index = self.constant_index.get(key)
+        if index is None:
+            index = self.constant_index[key] = len(self.constants)
+            self.constants.append(value)
+        return index
+
+    def add(self, kind, a=-1, b=-1, c=-1, token=None):
+        self.kinds.append(kind)
+        self.a.append(a)
+        self.b.append(b)
+        self.c.append(c)
+        if token is None:
+            self.offsets.append(0)
+        else:
+            self.offsets.append(token.pos)
+            if self.lines is None:
+                self.lines = token.lines
+        return len(self.kinds) - 1
+
+    def add_children(self, indices):
+        start = len(self.children)
+        self.children.extend(indices)
+        return start
+
+    # post-order without recursion, so StackParser trees convert too
+    @classmethod
+    def from_tree(cls, tree):
+        flat = cls()
+        done = []
+        work = [tree]
+        while work:
+            node = work.pop()
+            if type(node) is tuple:
+                node, count = node
+                indices = done[len(done) - count:]
+                del done[len(done) - count:]
+                done.append(flat.emit(node, indices))
+                continue
+            children = node_children(node)
+            work.append((node, len(children)))
+            work.extend(reversed(children))
+        return flat
+
+    def emit(self, node, indices):
+        kind = type(node)
+        if kind is NumberNode:
+            return self.add(FLAT_NUMBER, c=self.constant(node.value), token=node.token)
+        if kind is VarAccessNode:
+            return self.add(FLAT_VAR_ACCESS, c=self.constant(node.var_name.value), token=node.var_name)
+        if kind is VarAssignNode:
+            return self.add(FLAT_VAR_ASSIGN, indices[0], c=self.constant(node.var_name.value), token=node.var_name)
+        if kind is BinOpNode:
+            return self.add(FLAT_BINARY, indices[0], indices[1], self.operator(node.op), node.op)
+        if kind is LogicalOpNode:
+            return self.add(FLAT_LOGICAL, indices[0], indices[1], self.operator(node.op), node.op)
+        if kind is UnaryOpNode:
+            return self.add(FLAT_UNARY, indices[0], c=self.operator(node.op), token=node.op)
+        if kind is ListNode:
+            return self.add(FLAT_LIST, self.add_children(indices), len(indices))
+        if kind is IfNode:
+            pairs = len(node.cases)
+            last = indices[2 * pairs] if len(indices) > 2 * pairs else -1
+            return self.add(FLAT_IF, self.add_children(indices[:2 * pairs]), pairs, last)
+        if kind is SwitchNode:
+            pairs = len(node.cases)
+            last = indices[2 * pairs + 1] if len(indices) > 2 * pairs + 1 else -1
+            return self.add(FLAT_SWITCH, self.add_children(indices[:2 * pairs + 1]), pairs, last)
+        if kind is WhileNode:
+            return self.add(FLAT_WHILE, self.add_children(indices), len(indices) - 1)
+        if kind is ForNode:
+            if node.step is None:
+                indices = indices[:2] + [-1] + indices[2:]
+            return self.add(FLAT_FOR, self.add_children(indices), len(indices) - 3,
+                            self.constant(node.var_name.value), node.var_name)
+        if kind is BreakNode:
+            return self.add(FLAT_BREAK, token=node.token)
+        if kind is ContinueNode:
+            return self.add(FLAT_CONTINUE, token=node.token)
+        raise TypeError(f'FlatAST: unknown node {node!r}')
+
+    # may_jump for the node at index
+    def may_jump(self, index, kinds=(FLAT_BREAK, FLAT_CONTINUE)):
+        kind = self.kinds[index]
+        if kind in kinds:
+            return True
+        if kind == FLAT_IF:
+            start = self.a[index]
+        elif kind == FLAT_SWITCH:
+            start = self.a[index] + 1
+            kinds = tuple(jump for jump in kinds if jump != FLAT_BREAK)
+        else:
+            return False
+        branches = [self.children[pair + 1] for pair in range(start, start + 2 * self.b[index], 2)]
+        if self.c[index] >= 0:
+            branches.append(self.c[index])
+        return any(self.may_jump(branch, kinds) for branch in branches)
+
+    def operator(self, token):
+        return FLAT_OPERATOR_CODES[token.value if token.type == TK_KEYWORD else token.type]
+
+    def position(self, index):
+        if self.lines is None:
+            return None, None
+        return self.lines.position(self.offsets[index])
+
+    def nbytes(self):
+        arrays = (self.kinds, self.a, self.b, self.c, self.offsets, self.children)
+        return sum(len(a) * a.itemsize for a in arrays) + sum(sys.getsizeof(v) for v in self.constants)
+
+    def to_bytes(self):
+        return pickle.dumps((FLAT_FORMAT_VERSION, self.kinds, self.a, self.b, self.c, self.offsets,
+                             self.children, self.constants, self.lines), pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def from_bytes(cls, data):
+        state = pickle.loads(data)
+        if state[0] != FLAT_FORMAT_VERSION:
+            raise ValueError(f'FlatAST format {state[0]}, expected {FLAT_FORMAT_VERSION}')
+        flat = cls()
+        _, flat.kinds, flat.a, flat.b, flat.c, flat.offsets, flat.children, flat.constants, flat.lines = state
+        return flat
+
+
+# Walks a FlatAST by node index. A zero divisor is reported at the position
+# of the divisor's node, since flat literals carry no token
+class FlatInterpreter(Interpreter):
+    def __init__(self, parser, context):
+        super().__init__(parser, context)
+        self.flat = None
+        self.dispatch = {
+            FLAT_NUMBER: self.visit_number,
+            FLAT_VAR_ACCESS: self.visit_var_access,
+            FLAT_VAR_ASSIGN: self.visit_var_assign,
+            FLAT_BINARY: self.visit_binary,
+            FLAT_UNARY: self.visit_unary,
+            FLAT_LIST: self.visit_list,
+            FLAT_IF: self.visit_if,
+            FLAT_SWITCH: self.visit_switch,
+            FLAT_WHILE: self.visit_while,
+            FLAT_FOR: self.visit_for,
+            FLAT_BREAK: self.visit_break,
+            FLAT_CONTINUE: self.visit_continue,
+            FLAT_LOGICAL: self.visit_logical,
+        }
+
+    def interpret(self):
+        tree = self.parser.parse()
+        self.flat = tree if isinstance(tree, FlatAST) else FlatAST.from_tree(tree)
+        self.caches = [None] * len(self.flat.kinds)
+        return self.visit_index(self.flat.root)
+
+    def visit_index(self, index):
+        return self.dispatch[self.flat.kinds[index]](index)
+
+    def visit_number(self, index):
+        return Number(self.flat.constants[self.flat.c[index]])
+
+    # inline caches as in Interpreter.visit_VarAccessNode, one per node index
+    def visit_var_access(self, index):
+        var_name = self.flat.constants[self.flat.c[index]]
+        environment = self.context.symbol_table
+        cache = self.caches[index]
+        if cache is not None and cache[0] == environment.shape:
+            return cache[1][var_name]
+        scope_vars = self.resolve_var(var_name, environment)
+        self.caches[index] = (environment.shape, scope_vars)
+        return scope_vars[var_name]
+
+    def visit_var_assign(self, index):
+        value = self.visit_index(self.flat.a[index])
+        return self.assign(self.flat.constants[self.flat.c[index]], value)
+
+    def visit_binary(self, index):
+        flat = self.flat
+        left = self.visit_index(flat.a[index])
+        right = self.visit_index(flat.b[index])
+        operation = FLAT_OPERATIONS[flat.c[index]]
+        if operation is Number.div and isinstance(left, Number) and isinstance(right, Number) and right.value == 0:
+            line, column = flat.position(flat.b[index])
+            print(f"Division by zero At Line: {line} : Column: {column} "  )
+            exit(1)
+        return operation(left, right)
+
+    def visit_logical(self, index):
+        flat = self.flat
+        left = self.visit_index(flat.a[index])
+        operation = FLAT_OPERATIONS[flat.c[index]]
+        if left.is_true() is (operation is Number.ored):
+            return Number(int(left.value))
+        return operation(left, self.visit_index(flat.b[index]))
+
+    def visit_unary(self, index):
+        number = self.visit_index(self.flat.a[index])
+        return self.unary_op(FLAT_OPERATOR_TOKENS[self.flat.c[index]], number)
+
+    def visit_list(self, index):
+        flat = self.flat
+        start = flat.a[index]
+        return [self.visit_index(child) for child in flat.children[start:start + flat.b[index]]]
+
+    def visit_if(self, index):
+        flat = self.flat
+        children = flat.children
+        start = flat.a[index]
+        for pair in range(start, start + 2 * flat.b[index], 2):
+            if self.visit_index(children[pair]).is_true():
+                return self.visit_index(children[pair + 1])
+        if flat.c[index] >= 0:
+            return self.visit_index(flat.c[index])
+        return None
+
+    def visit_while(self, index):
+        flat = self.flat
+        start = flat.a[index]
+        condition = flat.children[start]
+        body = flat.children[start + 1:start + 1 + flat.b[index]].tolist()
+        visit_index = self.visit_index
+        if not any(flat.may_jump(child) for child in body):
+            while visit_index(condition).is_true():
+                for child in body:
+                    visit_index(child)
+            return None
+        while visit_index(condition).is_true():
+            for child in body:
+                value = visit_index(child)
+                if value is BREAK:
+                    return None
+                if value is CONTINUE:
+                    break
+        return None
+
+    def visit_for(self, index):
+        flat = self.flat
+        start = flat.a[index]
+        first = self.visit_index(flat.children[start]).value
+        last = self.visit_index(flat.children[start + 1]).value
+        step = 1
+        step_index = flat.children[start + 2]
+        if step_index >= 0:
+            step = self.visit_index(step_index).value
+            if step == 0:
+                line, column = flat.position(step_index)
+                print(f"Step cannot be zero At Line: {line} : Column: {column} "  )
+                exit(1)
+        var_name = flat.constants[flat.c[index]]
+        symbol_table = self.context.symbol_table
+        body = flat.children[start + 3:start + 3 + flat.b[index]].tolist()
+        visit_index = self.visit_index
+        if not any(flat.may_jump(child) for child in body):
+            for value in for_range(first, last, step):
+                symbol_table.set(var_name, Number(value))
+                for child in body:
+                    visit_index(child)
+            return None
+        for value in for_range(first, last, step):
+            symbol_table.set(var_name, Number(value))
+            for child in body:
+                jump = visit_index(child)
+                if jump is BREAK:
+                    return None
+                if jump is CONTINUE:
+                    break
+        return None
+
+    def visit_break(self, index):
+        return BREAK
+
+    def visit_continue(self, index):
+        return CONTINUE
+
+    def visit_switch(self, index):
+        flat = self.flat
+        children = flat.children
+        start = flat.a[index]
+        switch_value = self.visit_index(children[start])
+        for pair in range(start + 1, start + 1 + 2 * flat.b[index], 2):
+            if self.visit_index(children[pair]) == switch_value:
+                value = self.visit_index(children[pair + 1])
+                return None if value is BREAK else value
+        if flat.c[index] >= 0:
+            value = self.visit_index(flat.c[index])
+            return None if value is BREAK else value
+        return None
+
+# plain int/float counterparts of the Number methods in BINARY_OPERATIONS
+NATIVE_OPERATIONS = {
+    Number.add: lambda left, right: left + right,
+    Number.sub: lambda left, right: left - right,
+    Number.mul: lambda left, right: left * right,
+    Number.div: lambda left, right: left / right,
+    Number.powed: lambda left, right: left ** right,
+    Number.mod: lambda left, right: left % right,
+    Number.comp_gt: lambda left, right: int(left > right),
+    Number.comp_gte: lambda left, right: int(left >= right),
+    Number.comp_lt: lambda left, right: int(left < right),
+    Number.comp_lte: lambda left, right: int(left <= right),
+    Number.comp_eq: lambda left, right: int(left == right),
+    Number.comp_neq: lambda left, right: int(left != right),
+    Number.anded: lambda left, right: int(left and right),
+    Number.ored: lambda left, right: int(left or right),
+    no_operation: no_operation,
+}
+
+
+def box(value):
+    return Number(value) if isinstance(value, (int, float, complex)) else value
+
+
+# Evaluates on plain int/float values: variables live unboxed in self.values
+# for the whole run and are written back to the symbol table as Numbers when
+# it ends, and run() gets its results boxed. A zero divisor is reported at
+# the position of the divisor expression, as there is no Number to carry one
+class NativeInterpreter(Interpreter):
+    def interpret(self):
+        tree = self.parser.parse()
+        self.values = {}
+        environments = []
+        environment = self.context.symbol_table
+        while environment is not None:
+            environments.append(environment)
+            environment = environment.parent
+        for environment in reversed(environments):
+            for name, value in environment.vars.items():
+                self.values[name] = value.value if isinstance(value, Number) else value
+        # dict for insertion order, so the symbol table lists names as Interpreter does
+        self.assigned = {}
+        try:
+            result = self.execute(tree)
+        finally:
+            for name in self.assigned:
+                self.context.symbol_table.set(name, box(self.values[name]))
+        if isinstance(result, list):
+            return [box(value) for value in result]
+        return box(result)
+
+    def execute(self, tree):
+        return self.visit(tree)
+
+    # Runs fn on a frame of the values of names, by slot, and copies the
+    # assigned slots that no longer hold their initial value back, also when
+    # fn stops the program: first the slots fn noted in created as it set
+    # them for the first time, in that order, then the others
+    def run_in_frame(self, fn, names, assigned_slots, created=()):
+        frame = [self.values.get(name) for name in names]
+        initial = frame[:]
+        try:
+            return fn(frame)
+        finally:
+            for slot in [*created, *assigned_slots]:
+                value = frame[slot]
+                if value is not None and value is not initial[slot]:
+                    self.values[names[slot]] = value
+                    self.assigned[names[slot]] = None
+
+    def visit_NumberNode(self, node):
+        return node.value
+
+    def visit_VarAccessNode(self, node):
+        var_name = node.var_name.value
+        try:
+            return self.values[var_name]
+        except KeyError:
+            print(f"Undefined variable '{var_name}'")
+            exit(1)
+
+    def visit_VarAssignNode(self, node):
+        var_name = node.var_name.value
+        value = self.visit(node.value)
+        if value == None:
+            print(f"Undefined variable '{var_name}'")
+            exit(1)
+        self.values[var_name] = value
+        self.assigned[var_name] = None
+        return value
+
+    def visit_BinOpNode(self, node):
+        left = self.visit(node.left)
+        right = self.visit(node.right)
+        if right is None:
+            # Number methods give None for a right operand that is no Number
+            return None
+        operation = node.operation
+        if operation is Number.div and right == 0:
+            print(f"Division by zero At Line: {node.right.line} : Column: {node.right.column} "  )
+            exit(1)
+        return NATIVE_OPERATIONS[operation](left, right)
+
+    def visit_LogicalOpNode(self, node):
+        left = self.visit(node.left)
+        if bool(left) is node.skip_when:
+            return int(left)
+        right = self.visit(node.right)
+        return None if right is None else int(right)
+
+    def visit_UnaryOpNode(self, node):
+        value = self.visit(node.node)
+        if node.op.type == TK_MINUS:
+            return value * -1
+        if node.op.match(TK_KEYWORD, 'not') and value == 0:
+            return 1
+        return value
+
+    # A condition that is None stops the program, as Number.is_true does in
+    # Interpreter; None != 0, so it is checked once a condition passes
+    def visit_IfNode(self, node):
+        for condition, expr in node.cases:
+            value = self.visit(condition)
+            if value != 0:
+                if value is None:
+                    none_condition()
+                return self.visit(expr)
+        if node.else_case:
+            return self.visit(node.else_case)
+        return None
+
+    def visit_WhileNode(self, node):
+        condition = node.condition
+        test = self.visitors[type(condition)]
+        body = [(self.visitors[type(child)], child) for child in node.body]
+        if not any(may_jump(child) for child in node.body):
+            while True:
+                value = test(condition)
+                if value == 0:
+                    return None
+                if value is None:
+                    none_condition()
+                for visit, child in body:
+                    visit(child)
+        while True:
+            value = test(condition)
+            if value == 0:
+                return None
+            if value is None:
+                none_condition()
+            for visit, child in body:
+                value = visit(child)
+                if value is BREAK:
+                    return None
+                if value is CONTINUE:
+                    break
+
+    def visit_ForNode(self, node):
+        start = self.visit(node.start)
+        end = self.visit(node.end)
+        step = 1
+        if node.step is not None:
+            step = self.visit(node.step)
+            if step == 0:
+                zero_step(node.step)
+        var_name = node.var_name.value
+        values = self.values
+        assigned = self.assigned
+        body = [(self.visitors[type(child)], child) for child in node.body]
+        if not any(may_jump(child) for child in node.body):
+            for value in for_range(start, end, step):
+                values[var_name] = value
+                assigned[var_name] = None
+                for visit, child in body:
+                    visit(child)
+            return None
+        for value in for_range(start, end, step):
+            values[var_name] = value
+            assigned[var_name] = None
+            for visit, child in body:
+                jump = visit(child)
+                if jump is BREAK:
+                    return None
+                if jump is CONTINUE:
+                    break
+        return None
+
+
+RESOLVED_DEFINED = 0    # set on every path to the access: a plain indexed load
+RESOLVED_UNDEFINED = 1  # neither in the environment nor assigned anywhere
+RESOLVED_UNKNOWN = 2    # set on some paths only: the load checks its slot
+
+
+# Gives each variable of a program a fixed slot in a list-backed frame: the
+# names of the environment first, then the program's own in the order they
+# appear. A forward pass tracks the names set on every path so far (an
+# access that did not stop the program has set its name, too), and gives
+# each VarAccessNode a state, so that only RESOLVED_UNKNOWN reads need a check
+# at run time. Frames hold unboxed values, and None in slots not yet set.
+# The names set so far are one set with a journal of the names added to it,
+# so a branch is walked in place and its additions undone afterwards.
+# Stores to names not set on every path to them may create the variable;
+# the engines note those as they run, so new names reach the symbol table
+# in the order the tree walker creates them
+class Resolver:
+    def __init__(self, defined):
+        self.slots = {name: index for index, name in enumerate(defined)}
+        self.assignable = set()
+        # dict for order, so assignments are written back in program order
+        self.assigned = {}
+        self.states = {}
+        self.creating = set()
+        self.defined = set()
+        self.journal = []
+
+    def resolve(self, tree):
+        stack = [tree]
+        while stack:
+            node = stack.pop()
+            if type(node) is VarAssignNode or type(node) is ForNode:
+                self.assignable.add(node.var_name.value)
+            stack.extend(node_children(node))
+        self.defined = set(self.slots)
+        self.journal = []
+        self.walk(tree)
+        return self
+
+    def slot(self, var_name):
+        return self.slots.setdefault(var_name, len(self.slots))
+
+    def state(self, node):
+        return self.states[id(node)]
+
+    # whether the VarAssignNode or ForNode may be the first to set its name
+    def creates(self, node):
+        return id(node) in self.creating
+
+    def define(self, var_name):
+        if var_name not in self.defined:
+            self.defined.add(var_name)
+            self.journal.append(var_name)
+
+    # forgets the names added since the journal had length mark
+    def undo(self, mark):
+        self.defined.difference_update(self.journal[mark:])
+        del self.journal[mark:]
+
+    # walks the branches of an if or switch, whose conditions run in turn
+    # until one holds: a name stays set if the else branch sets it, or the
+    # conditions do, and every branch taken does, too
+    def walk_branches(self, cases, last):
+        mark = len(self.journal)
+        branches = []
+        for condition, expr in cases:
+            self.walk(condition)
+            branch = len(self.journal)
+            self.walk(expr)
+            branches.append(set(self.journal[mark:]))
+            self.undo(branch)
+        if last is not None:
+            self.walk(last)
+        kept = [name for name in self.journal[mark:] if all(name in branch for branch in branches)]
+        self.undo(mark)
+        for name in kept:
+            self.define(name)
+
+    def walk(self, node):
+        kind = type(node)
+        if kind is VarAccessNode:
+            var_name = node.var_name.value
+            self.slot(var_name)
+            if var_name in self.defined:
+                state = RESOLVED_DEFINED
+            elif var_name in self.assignable:
+                state = RESOLVED_UNKNOWN
+            else:
+                state = RESOLVED_UNDEFINED
+            # a node shared by several places gets the state safe for all
+            self.states[id(node)] = max(state, self.states.get(id(node), state))
+            self.define(var_name)
+        elif kind is VarAssignNode:
+            self.walk(node.value)
+            var_name = node.var_name.value
+            self.slot(var_name)
+            self.assigned.setdefault(var_name, None)
+            if var_name not in self.defined:
+                self.creating.add(id(node))
+            self.define(var_name)
+        elif kind is IfNode:
+            self.walk_branches(node.cases, node.else_case or None)
+        elif kind is SwitchNode:
+            self.walk(node.condition)
+            self.walk_branches(node.cases, node.default_case)
+        elif kind is WhileNode:
+            # the body may not run at all, and later iterations only add names
+            self.walk(node.condition)
+            mark = len(self.journal)
+            for child in node.body:
+                self.walk(child)
+            self.undo(mark)
+        elif kind is ForNode:
+            # the counter is set in the body only, which may not run either
+            for bound in (node.start, node.end, node.step):
+                if bound is not None:
+                    self.walk(bound)
+            var_name = node.var_name.value
+            self.slot(var_name)
+            self.assigned.setdefault(var_name, None)
+            if var_name not in self.defined:
+                self.creating.add(id(node))
+            mark = len(self.journal)
+            self.define(var_name)
+            for child in node.body:
+                self.walk(child)
+            self.undo(mark)
+        elif kind is LogicalOpNode:
+            # the right operand may be skipped
+            self.walk(node.left)
+            mark = len(self.journal)
+            self.walk(node.right)
+            self.undo(mark)
+        else:
+            for child in node_children(node):
+                self.walk(child)
+
+
+def undefined_variable(var_name):
+    print(f"Undefined variable '{var_name}'")
+    exit(1)
+
+
+OP_CONST = 0
+OP_LOAD = 1
+OP_STORE = 2
+OP_POP = 3
+OP_STORE_POP = 4      # arg: slot; OP_STORE then OP_POP, for a statement whose value is dropped
+OP_ADD = 5            # OP_ADD..OP_NEQ arg: 0 pops the right operand, k > 0 is constant
+                      # k - 1 and ~k a variable name index
+OP_SUB = 6
+OP_MUL = 7
+OP_DIV = 8
+OP_POW = 9
+OP_MOD = 10
+OP_GT = 11
+OP_GTE = 12
+OP_LT = 13
+OP_LTE = 14
+OP_EQ = 15
+OP_NEQ = 16
+OP_BINARY = 17        # arg: index into Bytecode.operations; None right operand gives None
+OP_NEG = 18
+OP_NOT = 19
+OP_JUMP = 20          # arg: target
+OP_JUMP_IF_FALSE = 21 # pops the condition
+OP_JUMP_IF_TRUE = 22  # pops the condition; closes a loop, whose test comes after its body,
+                      # and takes a guard's break or continue
+OP_CASE = 23          # pops a case value, jumps to arg unless it equals the switch value below it
+OP_LIST = 24          # arg: number of values to collect
+OP_LOAD_CHECKED = 25  # arg: slot; OP_LOAD of a slot that may be unset
+OP_UNDEFINED = 26     # arg: slot that is never set; stops the program
+OP_STORE_CHECKED = 27 # arg: slot; OP_STORE of a value that may be None
+OP_FOR_RANGE = 28     # pops step, end and start, pushes an iterator of the counter's values;
+                      # arg: counter slot + 1 to note in created if the loop runs, or 0
+OP_FOR = 29           # arg: slot; stores the iterator's next value and skips the OP_JUMP after
+                      # it, or pops the exhausted iterator and takes that jump
+OP_AND = 30           # arg: target; the left operand of an 'and': a false one becomes
+                      # int() of it and is jumped to arg with, a true one is popped
+OP_OR = 31            # arg: target; OP_AND with a true left operand deciding
+OP_INT = 32           # int() of the right operand of an and/or, leaving None as it is
+OP_STORE_NEW = 33     # arg: slot; OP_STORE_CHECKED of a store that may create its variable,
+                      # noting the slot in created
+OP_CONDITION = 34     # stops the program as Interpreter does if the condition on the stack is None
+
+OPCODE_NAMES = [name for name, value in sorted(
+    ((name, value) for name, value in globals().items() if name.startswith('OP_')), key=lambda item: item[1])]
+
+BINARY_OPCODES = {
+    Number.add: OP_ADD,
+    Number.sub: OP_SUB,
+    Number.mul: OP_MUL,
+    Number.div: OP_DIV,
+    Number.powed: OP_POW,
+    Number.mod: OP_MOD,
+    Number.comp_gt: OP_GT,
+    Number.comp_gte: OP_GTE,
+    Number.comp_lt: OP_LT,
+    Number.comp_lte: OP_LTE,
+    Number.comp_eq: OP_EQ,
+    Number.comp_neq: OP_NEQ,
+}
+
+
+# (opcode, arg) pairs in one int array, with the pools the args index. The
+# positions table maps the pc of a division to its divisor node, and that of
+# an OP_FOR_RANGE to its step node; names gives
+# the variable of each frame slot and assigned the slots the program sets
+class Bytecode:
+    def __init__(self, code, constants, names, operations, positions, assigned):
+        self.code = code
+        self.constants = constants
+        self.names = names
+        self.operations = operations
+        self.positions = positions
+        self.assigned = assigned
+
+    def disassemble(self):
+        lines = []
+        for pc in range(0, len(self.code), 2):
+            op, arg = self.code[pc], self.code[pc + 1]
+            if op == OP_CONST:
+                arg = f'{arg} ({self.constants[arg]!r})'
+            elif op in (OP_LOAD, OP_STORE, OP_STORE_POP, OP_LOAD_CHECKED, OP_UNDEFINED, OP_STORE_CHECKED, OP_FOR,
+                        OP_STORE_NEW):
+                arg = f'{arg} ({self.names[arg]})'
+            elif OP_ADD <= op < OP_BINARY and arg > 0:
+                arg = f'{arg} (const {self.constants[arg - 1]!r})'
+            elif OP_ADD <= op < OP_BINARY and arg < 0:
+                arg = f'{arg} (var {self.names[~arg]})'
+            lines.append(f'{pc:6} {OPCODE_NAMES[op]:18} {arg}')
+        return '\n'.join(lines)
+
+
+# Compiles a tree to Bytecode, with variables in the frame slots of a resolved
+# Resolver. Each compile_ method returns whether the value it leaves on the
+# stack may be None (an if without else, a switch without default, a while);
+# only operators whose right operand may be None need the checking OP_BINARY,
+# all others get their own opcode
+class Compiler:
+    def __init__(self, resolver):
+        self.resolver = resolver
+        self.code = array('i')
+        self.constants = []
+        self.constant_index = {}
+        self.operations = []
+        self.positions = {}
+        # per enclosing loop or switch, innermost last: the OP_JUMPs of its
+        # breaks and of its continues (None for a switch) to patch
+        self.targets = []
+        self.compilers = {
+            NumberNode: self.compile_NumberNode,
+            VarAccessNode: self.compile_VarAccessNode,
+            VarAssignNode: self.compile_VarAssignNode,
+            BinOpNode: self.compile_BinOpNode,
+            LogicalOpNode: self.compile_LogicalOpNode,
+            UnaryOpNode: self.compile_UnaryOpNode,
+            ListNode: self.compile_ListNode,
+            IfNode: self.compile_IfNode,
+            SwitchNode: self.compile_SwitchNode,
+            WhileNode: self.compile_WhileNode,
+            ForNode: self.compile_ForNode,
+            BreakNode: self.compile_BreakNode,
+            ContinueNode: self.compile_ContinueNode,
+        }
+
+    def compile(self, tree):
+        self.compile_node(tree)
+        slots = self.resolver.slots
+        assigned = [slots[name] for name in self.resolver.assigned]
+        return Bytecode(self.code, self.constants, list(slots), self.operations, self.positions, assigned)
+
+    def compile_node(self, node):
+        return self.compilers[type(node)](node)
+
+    def emit(self, op, arg=0):
+        self.code.append(op)
+        self.code.append(arg)
+        return len(self.code) - 2
+
+    def patch(self, at, target):
+        self.code[at + 1] = target
+
+    def constant(self, value):
+        key = (type(value), value)
+        if key not in self.constant_index:
+            self.constant_index[key] = len(self.constants)
+            self.constants.append(value)
+        return self.constant_index[key]
+
+    def compile_NumberNode(self, node):
+        self.emit(OP_CONST, self.constant(node.value))
+        return False
+
+    def compile_VarAccessNode(self, node):
+        state = self.resolver.state(node)
+        slot = self.resolver.slots[node.var_name.value]
+        if state == RESOLVED_DEFINED:
+            self.emit(OP_LOAD, slot)
+        elif state == RESOLVED_UNKNOWN:
+            self.emit(OP_LOAD_CHECKED, slot)
+        else:
+            self.emit(OP_UNDEFINED, slot)
+        return False
+
+    def compile_VarAssignNode(self, node):
+        optional = self.compile_node(node.value)
+        if self.resolver.creates(node):
+            op = OP_STORE_NEW
+        else:
+            op = OP_STORE_CHECKED if optional else OP_STORE
+        self.emit(op, self.resolver.slots[node.var_name.value])
+        return False
+
+    def compile_BinOpNode(self, node):
+        self.compile_node(node.left)
+        opcode = BINARY_OPCODES.get(node.operation)
+        right = node.right
+        if opcode is not None and type(right) is NumberNode:
+            at = self.emit(opcode, self.constant(right.value) + 1)
+            optional = False
+        elif opcode is not None and type(right) is VarAccessNode and self.resolver.state(right) == RESOLVED_DEFINED:
+            at = self.emit(opcode, ~self.resolver.slots[right.var_name.value])
+            optional = False
+        else:
+            optional = self.compile_node(right)
+            if optional or opcode is None:
+                at = self.emit(OP_BINARY, len(self.operations))
+                self.operations.append(NATIVE_OPERATIONS[node.operation])
+            else:
+                at = self.emit(opcode)
+        if node.operation is Number.div:
+            self.positions[at] = node.right
+        return optional or opcode is None
+
+    def compile_LogicalOpNode(self, node):
+        self.compile_node(node.left)
+        at = self.emit(OP_OR if node.skip_when else OP_AND)
+        optional = self.compile_node(node.right)
+        if not yields_int(node.right):
+            self.emit(OP_INT)
+        self.patch(at, len(self.code))
+        return optional
+
+    def compile_UnaryOpNode(self, node):
+        optional = self.compile_node(node.node)
+        if node.op.type == TK_MINUS:
+            self.emit(OP_NEG)
+            return False
+        if node.op.match(TK_KEYWORD, 'not'):
+            self.emit(OP_NOT)
+        return optional
+
+    def compile_ListNode(self, node):
+        for child in node.node_list:
+            self.compile_node(child)
+        self.emit(OP_LIST, len(node.node_list))
+        return False
+
+    # a condition that may be None is checked before its jump tests it
+    def compile_condition(self, node):
+        if self.compile_node(node):
+            self.emit(OP_CONDITION)
+
+    def compile_IfNode(self, node):
+        ends = []
+        optional = False
+        for condition, expr in node.cases:
+            self.compile_condition(condition)
+            skip = self.emit(OP_JUMP_IF_FALSE)
+            optional |= self.compile_node(expr)
+            ends.append(self.emit(OP_JUMP))
+            self.patch(skip, len(self.code))
+        if node.else_case:
+            optional |= self.compile_node(node.else_case)
+        else:
+            self.emit(OP_CONST, self.constant(None))
+            optional = True
+        for at in ends:
+            self.patch(at, len(self.code))
+        return optional
+
+    def compile_SwitchNode(self, node):
+        self.compile_node(node.condition)
+        ends = []
+        optional = False
+        self.targets.append((ends, None))
+        for condition, expr in node.cases:
+            self.compile_node(condition)
+            skip = self.emit(OP_CASE)
+            self.emit(OP_POP)
+            optional |= self.compile_node(expr)
+            ends.append(self.emit(OP_JUMP))
+            self.patch(skip, len(self.code))
+        self.emit(OP_POP)
+        if node.default_case != None:
+            optional |= self.compile_node(node.default_case)
+        else:
+            self.emit(OP_CONST, self.constant(None))
+            optional = True
+        self.targets.pop()
+        for at in ends:
+            self.patch(at, len(self.code))
+        return optional
+
+    # the test comes after the body, so an iteration takes one jump, not two
+    def compile_WhileNode(self, node):
+        enter = self.emit(OP_JUMP)
+        body = len(self.code)
+        breaks, continues = [], []
+        self.targets.append((breaks, continues))
+        for child in node.body:
+            self.compile_statement(child)
+        self.targets.pop()
+        self.patch(enter, len(self.code))
+        for at in continues:
+            self.patch(at, len(self.code))
+        self.compile_condition(node.condition)
+        self.emit(OP_JUMP_IF_TRUE, body)
+        for at in breaks:
+            self.patch(at, len(self.code))
+        self.emit(OP_CONST, self.constant(None))
+        return True
+
+    # the bounds are evaluated once into an iterator below the body's values
+    def compile_ForNode(self, node):
+        self.compile_node(node.start)
+        self.compile_node(node.end)
+        if node.step is None:
+            self.emit(OP_CONST, self.constant(1))
+        else:
+            self.compile_node(node.step)
+        slot = self.resolver.slots[node.var_name.value]
+        at = self.emit(OP_FOR_RANGE, slot + 1 if self.resolver.creates(node) else 0)
+        if node.step is not None:
+            self.positions[at] = node.step
+        loop = self.emit(OP_FOR, slot)
+        exit_at = self.emit(OP_JUMP)
+        breaks, continues = [], []
+        self.targets.append((breaks, continues))
+        for child in node.body:
+            self.compile_statement(child)
+        self.targets.pop()
+        self.emit(OP_JUMP, loop)
+        for at in continues:
+            self.patch(at, loop)
+        if breaks:
+            # a break leaves the iterator that OP_FOR pops when it runs out
+            for at in breaks:
+                self.patch(at, len(self.code))
+            self.emit(OP_POP)
+        self.patch(exit_at, len(self.code))
+        self.emit(OP_CONST, self.constant(None))
+        return True
+
+    # Jumps straight to the end of the innermost loop or switch, or to the
+    # next iteration of the innermost loop. A jump stands where a statement
+    # or a branch starts, so the stack holds just what the loop or switch
+    # keeps below its body: the iterator of a for, which its exit pops, and
+    # nothing for a switch, whose value None the break pushes
+    def compile_BreakNode(self, node):
+        breaks, continues = self.targets[-1]
+        if continues is None:
+            self.emit(OP_CONST, self.constant(None))
+        breaks.append(self.emit(OP_JUMP))
+        return True
+
+    def compile_ContinueNode(self, node):
+        for breaks, continues in reversed(self.targets):
+            if continues is not None:
+                continues.append(self.emit(OP_JUMP))
+                return True
+
+    # A loop body statement, whose value is dropped: an assignment stores
+    # without keeping it, and a guard is one conditional jump. The loop is
+    # the innermost target of its body's statements
+    def compile_statement(self, node):
+        jump = guard_jump(node)
+        if jump is not None:
+            self.compile_condition(node.cases[0][0])
+            breaks, continues = self.targets[-1]
+            (breaks if type(jump) is BreakNode else continues).append(self.emit(OP_JUMP_IF_TRUE))
+        elif type(node) is not VarAssignNode or self.resolver.creates(node):
+            self.compile_node(node)
+            self.emit(OP_POP)
+        elif self.compile_node(node.value):
+            self.emit(OP_STORE_CHECKED, self.resolver.slots[node.var_name.value])
+            self.emit(OP_POP)
+        else:
+            self.emit(OP_STORE_POP, self.resolver.slots[node.var_name.value])
+
+
+# Runs Bytecode on a value stack over a frame of the same unboxed variables
+# as NativeInterpreter; opcodes are tested roughly in order of frequency
+class VMInterpreter(NativeInterpreter):
+    def execute(self, tree):
+        if isinstance(tree, Bytecode):
+            bytecode = tree
+        else:
+            bytecode = without_gc(self.compile, tree)
+        created = {}
+        return self.run_in_frame(lambda frame: self.run_bytecode(bytecode, frame, created),
+                                 bytecode.names, bytecode.assigned, created)
+
+    def compile(self, tree):
+        return Compiler(Resolver(self.values).resolve(tree)).compile(tree)
+
+    def run_bytecode(self, bytecode, frame, created):
+        code = bytecode.code.tolist()
+        constants = bytecode.constants
+        names = bytecode.names
+        operations = bytecode.operations
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        pc = 0
+        end = len(code)
+        while pc < end:
+            op = code[pc]
+            arg = code[pc + 1]
+            pc += 2
+            if op < OP_ADD:
+                if op == OP_LOAD:
+                    push(frame[arg])
+                elif op == OP_CONST:
+                    push(constants[arg])
+                elif op == OP_STORE_POP:
+                    frame[arg] = pop()
+                elif op == OP_STORE:
+                    frame[arg] = stack[-1]
+                else:
+                    pop()
+            elif op < OP_BINARY:
+                if arg == 0:
+                    right = pop()
+                elif arg > 0:
+                    right = constants[arg - 1]
+                else:
+                    right = frame[~arg]
+                if op == OP_ADD:
+                    stack[-1] = stack[-1] + right
+                elif op == OP_SUB:
+                    stack[-1] = stack[-1] - right
+                elif op == OP_MUL:
+                    stack[-1] = stack[-1] * right
+                elif op == OP_LT:
+                    stack[-1] = int(stack[-1] < right)
+                elif op == OP_DIV:
+                    if right == 0:
+                        self.division_by_zero(bytecode, pc - 2)
+                    stack[-1] = stack[-1] / right
+                elif op == OP_MOD:
+                    stack[-1] = stack[-1] % right
+                elif op == OP_LTE:
+                    stack[-1] = int(stack[-1] <= right)
+                elif op == OP_GT:
+                    stack[-1] = int(stack[-1] > right)
+                elif op == OP_GTE:
+                    stack[-1] = int(stack[-1] >= right)
+                elif op == OP_EQ:
+                    stack[-1] = int(stack[-1] == right)
+                elif op == OP_NEQ:
+                    stack[-1] = int(stack[-1] != right)
+                else:
+                    stack[-1] = stack[-1] ** right
+            elif op == OP_FOR:
+                value = next(stack[-1], None)
+                if value is None:
+                    pop()
+                else:
+                    frame[arg] = value
+                    pc += 2
+            elif op == OP_JUMP_IF_TRUE:
+                if pop() != 0:
+                    pc = arg
+            elif op == OP_JUMP_IF_FALSE:
+                if pop() == 0:
+                    pc = arg
+            elif op == OP_JUMP:
+                pc = arg
+            elif op == OP_AND:
+                if stack[-1]:
+                    pop()
+                else:
+                    stack[-1] = int(stack[-1])
+                    pc = arg
+            elif op == OP_OR:
+                if stack[-1]:
+                    stack[-1] = int(stack[-1])
+                    pc = arg
+                else:
+                    pop()
+            elif op == OP_INT:
+                if stack[-1] is not None:
+                    stack[-1] = int(stack[-1])
+            elif op == OP_STORE_NEW:
+                value = stack[-1]
+                if value is None:
+                    undefined_variable(names[arg])
+                created[arg] = None
+                frame[arg] = value
+            elif op == OP_CONDITION:
+                if stack[-1] is None:
+                    none_condition()
+            elif op == OP_CASE:
+                if pop() != stack[-1]:
+                    pc = arg
+            elif op == OP_NEG:
+                stack[-1] = stack[-1] * -1
+            elif op == OP_NOT:
+                if stack[-1] == 0:
+                    stack[-1] = 1
+            elif op == OP_BINARY:
+                right = pop()
+                if right is None:
+                    stack[-1] = None
+                    continue
+                if pc - 2 in bytecode.positions and right == 0:
+                    self.division_by_zero(bytecode, pc - 2)
+                stack[-1] = operations[arg](stack[-1], right)
+            elif op == OP_LIST:
+                values_list = stack[len(stack) - arg:]
+                del stack[len(stack) - arg:]
+                push(values_list)
+            elif op == OP_LOAD_CHECKED:
+                value = frame[arg]
+                if value is None:
+                    undefined_variable(names[arg])
+                push(value)
+            elif op == OP_STORE_CHECKED:
+                value = stack[-1]
+                if value is None:
+                    undefined_variable(names[arg])
+                frame[arg] = value
+            elif op == OP_FOR_RANGE:
+                step = pop()
+                last = pop()
+                if step == 0:
+                    zero_step(bytecode.positions[pc - 2])
+                if arg and for_runs(stack[-1], last, step):
+                    created[arg - 1] = None
+                stack[-1] = iter(for_range(stack[-1], last, step))
+            else:
+                undefined_variable(names[arg])
+        return stack[-1]
+
+    def division_by_zero(self, bytecode, pc):
+        node = bytecode.positions[pc]
+        print(f"Division by zero At Line: {node.line} : Column: {node.column} "  )
+        exit(1)
+
+
+# closure factories per operator: one for a computed right operand and one
+# for a literal right operand c
+CLOSURE_OPERATIONS = {
+    Number.add: (lambda l, r: lambda env: l(env) + r(env), lambda l, c: lambda env: l(env) + c),
+    Number.sub: (lambda l, r: lambda env: l(env) - r(env), lambda l, c: lambda env: l(env) - c),
+    Number.mul: (lambda l, r: lambda env: l(env) * r(env), lambda l, c: lambda env: l(env) * c),
+    Number.powed: (lambda l, r: lambda env: l(env) ** r(env), lambda l, c: lambda env: l(env) ** c),
+    Number.mod: (lambda l, r: lambda env: l(env) % r(env), lambda l, c: lambda env: l(env) % c),
+    Number.comp_gt: (lambda l, r: lambda env: int(l(env) > r(env)), lambda l, c: lambda env: int(l(env) > c)),
+    Number.comp_gte: (lambda l, r: lambda env: int(l(env) >= r(env)), lambda l, c: lambda env: int(l(env) >= c)),
+    Number.comp_lt: (lambda l, r: lambda env: int(l(env) < r(env)), lambda l, c: lambda env: int(l(env) < c)),
+    Number.comp_lte: (lambda l, r: lambda env: int(l(env) <= r(env)), lambda l, c: lambda env: int(l(env) <= c)),
+    Number.comp_eq: (lambda l, r: lambda env: int(l(env) == r(env)), lambda l, c: lambda env: int(l(env) == c)),
+    Number.comp_neq: (lambda l, r: lambda env: int(l(env) != r(env)), lambda l, c: lambda env: int(l(env) != c)),
+}
+
+# comparisons as conditions: the same factories without the int()
+CLOSURE_TESTS = {
+    Number.comp_gt: (lambda l, r: lambda env: l(env) > r(env), lambda l, c: lambda env: l(env) > c),
+    Number.comp_gte: (lambda l, r: lambda env: l(env) >= r(env), lambda l, c: lambda env: l(env) >= c),
+    Number.comp_lt: (lambda l, r: lambda env: l(env) < r(env), lambda l, c: lambda env: l(env) < c),
+    Number.comp_lte: (lambda l, r: lambda env: l(env) <= r(env), lambda l, c: lambda env: l(env) <= c),
+    Number.comp_eq: (lambda l, r: lambda env: l(env) == r(env), lambda l, c: lambda env: l(env) == c),
+    Number.comp_neq: (lambda l, r: lambda env: l(env) != r(env), lambda l, c: lambda env: l(env) != c),
+}
+
+
+# Turns every node into a Python closure over its children's closures once;
+# running the program is then a call of the root closure on a frame of the
+# unboxed variables, with slots from a resolved Resolver. Like Compiler, each
+# compile_ method also says whether the value may be None, and only then does
+# an operator check its right operand
+class ClosureCompiler:
+    def __init__(self, resolver):
+        self.resolver = resolver
+        # slots noted by stores that may create their variable, as they run
+        self.created = {}
+        self.compilers = {
+            NumberNode: self.compile_NumberNode,
+            VarAccessNode: self.compile_VarAccessNode,
+            VarAssignNode: self.compile_VarAssignNode,
+            BinOpNode: self.compile_BinOpNode,
+            LogicalOpNode: self.compile_LogicalOpNode,
+            UnaryOpNode: self.compile_UnaryOpNode,
+            ListNode: self.compile_ListNode,
+            IfNode: self.compile_IfNode,
+            SwitchNode: self.compile_SwitchNode,
+            WhileNode: self.compile_WhileNode,
+            ForNode: self.compile_ForNode,
+            BreakNode: self.compile_BreakNode,
+            ContinueNode: self.compile_ContinueNode,
+        }
+
+    def compile(self, tree):
+        return self.compile_node(tree)[0]
+
+    def compile_node(self, node):
+        return self.compilers[type(node)](node)
+
+    def compile_NumberNode(self, node):
+        value = node.value
+        return (lambda env: value), False
+
+    def compile_VarAccessNode(self, node):
+        var_name = node.var_name.value
+        slot = self.resolver.slots[var_name]
+        state = self.resolver.state(node)
+        if state == RESOLVED_DEFINED:
+            return (lambda env: env[slot]), False
+        if state == RESOLVED_UNDEFINED:
+            return (lambda env: undefined_variable(var_name)), False
+
+        def load(env):
+            value = env[slot]
+            if value is None:
+                undefined_variable(var_name)
+            return value
+        return load, False
+
+    def compile_VarAssignNode(self, node):
+        var_name = node.var_name.value
+        slot = self.resolver.slots[var_name]
+        value_closure, optional = self.compile_node(node.value)
+        if self.resolver.creates(node):
+            created = self.created
+
+            def store_new(env):
+                value = value_closure(env)
+                if value is None:
+                    undefined_variable(var_name)
+                created[slot] = None
+                env[slot] = value
+                return value
+            return store_new, False
+        if not optional:
+            def store(env):
+                value = env[slot] = value_closure(env)
+                return value
+            return store, False
+
+        def store_checked(env):
+            value = value_closure(env)
+            if value is None:
+                undefined_variable(var_name)
+            env[slot] = value
+            return value
+        return store_checked, False
+
+    def compile_BinOpNode(self, node):
+        l = self.compile_node(node.left)[0]
+        operation = node.operation
+        right = node.right
+        if operation is Number.div:
+            r, optional = self.compile_node(right)
+
+            def divide(env):
+                left = l(env)
+                divisor = r(env)
+                if divisor is None:
+                    return None
+                if divisor == 0:
+                    print(f"Division by zero At Line: {right.line} : Column: {right.column} "  )
+                    exit(1)
+                return left / divisor
+            return divide, optional
+        factories = CLOSURE_OPERATIONS.get(operation)
+        if factories is not None and type(right) is NumberNode:
+            return factories[1](l, right.value), False
+        r, optional = self.compile_node(right)
+        if factories is not None and not optional:
+            return factories[0](l, r), False
+        native = NATIVE_OPERATIONS[operation]
+
+        def binary(env):
+            left = l(env)
+            value = r(env)
+            if value is None:
+                return None
+            return native(left, value)
+        return binary, True
+
+    def compile_LogicalOpNode(self, node):
+        l = self.compile_node(node.left)[0]
+        r, optional = self.compile_node(node.right)
+        if not yields_int(node.right):
+            right = r
+            if optional:
+                def r(env):
+                    value = right(env)
+                    return None if value is None else int(value)
+            else:
+                r = lambda env: int(right(env))
+        if node.skip_when:
+            def logical_or(env):
+                left = l(env)
+                return int(left) if left else r(env)
+            return logical_or, optional
+
+        def logical_and(env):
+            left = l(env)
+            return r(env) if left else int(left)
+        return logical_and, optional
+
+    def compile_UnaryOpNode(self, node):
+        operand, optional = self.compile_node(node.node)
+        if node.op.type == TK_MINUS:
+            return (lambda env: operand(env) * -1), False
+        if node.op.match(TK_KEYWORD, 'not'):
+            def negate(env):
+                value = operand(env)
+                return 1 if value == 0 else value
+            return negate, optional
+        return operand, optional
+
+    def compile_ListNode(self, node):
+        statements = [self.compile_node(child)[0] for child in node.node_list]
+        return (lambda env: [statement(env) for statement in statements]), False
+
+    # a closure giving whether node's value is not 0; one that may be None
+    # stops the program there, as in Interpreter
+    def compile_condition(self, node):
+        if type(node) is BinOpNode and node.operation in CLOSURE_TESTS:
+            factories = CLOSURE_TESTS[node.operation]
+            l = self.compile_node(node.left)[0]
+            if type(node.right) is NumberNode:
+                return factories[1](l, node.right.value)
+            r, optional = self.compile_node(node.right)
+            if not optional:
+                return factories[0](l, r)
+            native = NATIVE_OPERATIONS[node.operation]
+
+            def test(env):
+                left = l(env)
+                value = r(env)
+                if value is None:
+                    none_condition()
+                return native(left, value) != 0
+            return test
+        if type(node) is LogicalOpNode and yields_int(node.left) and yields_int(node.right):
+            # neither operand is truncated, so testing each tests the value
+            left = self.compile_condition(node.left)
+            right = self.compile_condition(node.right)
+            if node.skip_when:
+                return lambda env: left(env) or right(env)
+            return lambda env: left(env) and right(env)
+        closure, optional = self.compile_node(node)
+        if not optional:
+            return lambda env: closure(env) != 0
+
+        def test_checked(env):
+            value = closure(env)
+            if value is None:
+                none_condition()
+            return value != 0
+        return test_checked
+
+    def compile_IfNode(self, node):
+        cases = []
+        optional = node.else_case is None
+        for condition, expr in node.cases:
+            condition_closure = self.compile_condition(condition)
+            expr_closure, expr_optional = self.compile_node(expr)
+            cases.append((condition_closure, expr_closure))
+            optional |= expr_optional
+        else_closure = None
+        if node.else_case:
+            else_closure, else_optional = self.compile_node(node.else_case)
+            optional |= else_optional
+
+        def if_(env):
+            for condition, expr in cases:
+                if condition(env):
+                    return expr(env)
+            if else_closure is not None:
+                return else_closure(env)
+            return None
+        return if_, optional
+
+    def compile_SwitchNode(self, node):
+        switch_closure = self.compile_node(node.condition)[0]
+        cases = []
+        optional = node.default_case == None
+        for condition, expr in node.cases:
+            condition_closure = self.compile_node(condition)[0]
+            expr_closure, expr_optional = self.compile_node(expr)
+            cases.append((condition_closure, expr_closure))
+            optional |= expr_optional
+        default_closure = None
+        if node.default_case != None:
+            default_closure, default_optional = self.compile_node(node.default_case)
+            optional |= default_optional
+
+        def switch(env):
+            switch_value = switch_closure(env)
+            for condition, expr in cases:
+                if condition(env) == switch_value:
+                    return expr(env)
+            if default_closure is not None:
+                return default_closure(env)
+            return None
+        if not any(may_jump(expr, (BreakNode,)) for _, expr in node.cases) and \
+                not (default_closure is not None and may_jump(node.default_case, (BreakNode,))):
+            return switch, optional
+
+        def switch_breaks(env):
+            value = switch(env)
+            return None if value is BREAK else value
+        return switch_breaks, True
+
+    def compile_WhileNode(self, node):
+        condition = self.compile_condition(node.condition)
+        if any(may_jump(child) for child in node.body):
+            body = [self.compile_statement(child) for child in node.body]
+
+            def while_jumps(env):
+                while condition(env):
+                    for statement in body:
+                        value = statement(env)
+                        if value is BREAK:
+                            return None
+                        if value is CONTINUE:
+                            break
+                return None
+            return while_jumps, True
+        body = [self.compile_node(child)[0] for child in node.body]
+        if len(body) == 1:
+            statement = body[0]
+
+            def while_one(env):
+                while condition(env):
+                    statement(env)
+                return None
+            return while_one, True
+
+        def while_(env):
+            while condition(env):
+                for statement in body:
+                    statement(env)
+            return None
+        return while_, True
+
+    def compile_ForNode(self, node):
+        start = self.compile_node(node.start)[0]
+        end = self.compile_node(node.end)[0]
+        step_node = node.step
+        step = (lambda env: 1) if step_node is None else self.compile_node(step_node)[0]
+        slot = self.resolver.slots[node.var_name.value]
+        created = self.created if self.resolver.creates(node) else None
+
+        def values(env):
+            first = start(env)
+            last = end(env)
+            by = step(env)
+            if by == 0:
+                zero_step(step_node)
+            if created is not None and for_runs(first, last, by):
+                created[slot] = None
+            return for_range(first, last, by)
+        if any(may_jump(child) for child in node.body):
+            body = [self.compile_statement(child) for child in node.body]
+
+            def for_jumps(env):
+                for value in values(env):
+                    env[slot] = value
+                    for statement in body:
+                        jump = statement(env)
+                        if jump is BREAK:
+                            return None
+                        if jump is CONTINUE:
+                            break
+                return None
+            return for_jumps, True
+        body = [self.compile_node(child)[0] for child in node.body]
+        if len(body) == 1:
+            statement = body[0]
+
+            def for_one(env):
+                for value in values(env):
+                    env[slot] = value
+                    statement(env)
+                return None
+            return for_one, True
+
+        def for_(env):
+            for value in values(env):
+                env[slot] = value
+                for statement in body:
+                    statement(env)
+            return None
+        return for_, True
+
+    # a statement of a loop body with jumps; a guard skips the if closure
+    def compile_statement(self, node):
+        jump = guard_jump(node)
+        if jump is None:
+            return self.compile_node(node)[0]
+        test = self.compile_condition(node.cases[0][0])
+        value = BREAK if type(jump) is BreakNode else CONTINUE
+        return lambda env: value if test(env) else None
+
+    def compile_BreakNode(self, node):
+        return (lambda env: BREAK), False
+
+    def compile_ContinueNode(self, node):
+        return (lambda env: CONTINUE), False
+
+
+class ClosureInterpreter(NativeInterpreter):
+    def execute(self, tree):
+        resolver = Resolver(self.values).resolve(tree)
+        compiler = ClosureCompiler(resolver)
+        program = without_gc(compiler.compile, tree)
+        names = list(resolver.slots)
+        assigned = [resolver.slots[name] for name in resolver.assigned]
+        return self.run_in_frame(lambda frame: with_frozen_gc(program, frame), names, assigned, compiler.created)
+
+
+class TranspileError(Exception):
+    pass
+
+
+# NATIVE_OPERATIONS by index, for operators the transpiler leaves to binary()
+PYTHON_OPERATIONS = list(NATIVE_OPERATIONS.values())
+PYTHON_OPERATION_INDEX = {operation: index for index, operation in enumerate(NATIVE_OPERATIONS)}
+
+
+def python_binary(index, left, right):
+    if right is None:
+        return None
+    return PYTHON_OPERATIONS[index](left, right)
+
+
+def python_divide(left, right, line, column):
+    if right is None:
+        return None
+    if right == 0:
+        print(f"Division by zero At Line: {line} : Column: {column} "  )
+        exit(1)
+    return left / right
+
+
+def python_for_range(start, end, step, line, column, created=None, var_name=None):
+    if step == 0:
+        print(f"Step cannot be zero At Line: {line} : Column: {column} "  )
+        exit(1)
+    if created is not None and for_runs(start, end, step):
+        created[var_name] = None
+    return for_range(start, end, step)
+
+
+def python_create(created, var_name, value):
+    created[var_name] = None
+    return value
+
+
+def python_condition(value):
+    if value is None:
+        none_condition()
+    return value != 0
+
+
+def python_truncate(value):
+    return None if value is None else int(value)
+
+
+def python_check_defined(value, var_name):
+    if value == None:
+        print(f"Undefined variable '{var_name}'")
+        exit(1)
+    return value
+
+
+PYTHON_HELPERS = {
+    'binary': python_binary,
+    'divide': python_divide,
+    'check_defined': python_check_defined,
+    'for_range': python_for_range,
+    'truncate': python_truncate,
+    'create': python_create,
+    'condition': python_condition,
+}
+
+PYTHON_FORMAT_VERSION = 5
+# ast contexts and operators carry no position, so one instance of each is shared
+PYTHON_LOAD = ast.Load()
+PYTHON_STORE = ast.Store()
+PYTHON_COMPARISONS = {
+    Number.comp_gt: ast.Gt(),
+    Number.comp_gte: ast.GtE(),
+    Number.comp_lt: ast.Lt(),
+    Number.comp_lte: ast.LtE(),
+    Number.comp_eq: ast.Eq(),
+    Number.comp_neq: ast.NotEq(),
+}
+PYTHON_ARITHMETIC = {
+    Number.add: ast.Add(),
+    Number.sub: ast.Sub(),
+    Number.mul: ast.Mult(),
+    Number.powed: ast.Pow(),
+    Number.mod: ast.Mod(),
+}
+
+# A transpiled program: the code object of a module defining
+# program(values) -> (results, locals()), and the names it assigns in order
+class TranspiledProgram:
+    def __init__(self, code, assigned):
+        self.code = code
+        self.assigned = assigned
+
+    def function(self):
+        namespace = dict(PYTHON_HELPERS, __builtins__=builtins)
+        exec(self.code, namespace)
+        return namespace['program']
+
+    def to_bytes(self):
+        return marshal.dumps((PYTHON_FORMAT_VERSION, self.code, tuple(self.assigned)))
+
+    @classmethod
+    def from_bytes(cls, data):
+        version, code, assigned = marshal.loads(data)
+        if version != PYTHON_FORMAT_VERSION:
+            raise ValueError(f'transpiled program format {version}, expected {PYTHON_FORMAT_VERSION}')
+        return cls(code, list(assigned))
+
+
+# Lowers a tree to a Python module and compiles it. Variables become fast
+# locals named v_<name>, loaded from the values dict in the prologue;
+# statement-level if/switch/while become Python statements and nested ones
+# conditional expressions (a while inside an expression raises
+# TranspileError). Divisions carry their divisor's .bas line and column as
+# Python positions, so a ZeroDivisionError maps back through co_positions;
+# divisors without a position use divide(). As in Compiler, binary(),
+# check_defined() and condition() are only used where a value may be None,
+# and stores that may create their variable note its name in the local dict
+# created
+class Transpiler:
+    def __init__(self):
+        self.resolver = None
+        self.names = {}
+        self.assigned = {}
+        self.temps = 0
+        self.position = {'lineno': 1, 'col_offset': 0}
+        # kinds of the loops and statement switches around, innermost last
+        self.targets = []
+
+    def transpile(self, tree):
+        # without the environment, which a cached program does not know,
+        # every name not set on all paths before a store may be new there
+        self.resolver = Resolver(()).resolve(tree)
+        statements = tree.node_list if type(tree) is ListNode else [tree]
+        body = []
+        for node in statements:
+            self.statement(node, body, True)
+
+        function = ast.parse('def program(values):\n    result = []\n    append = result.append\n'
+                             '    created = {}\n').body[0]
+        prologue = ast.parse('\n'.join(
+            f'if {name!r} in values: v_{name} = values[{name!r}]' for name in self.names)).body
+        epilogue = ast.parse('return result, locals()').body
+        function.body = prologue + function.body + body + epilogue
+        module = ast.Module(body=[function], type_ignores=[])
+        return TranspiledProgram(compile(module, '<basic>', 'exec'), list(self.assigned))
+
+    # Builds an ast node at the position of the statement being lowered;
+    # setting it here is much cheaper than ast.fix_missing_locations
+    def make(self, kind, *fields):
+        return kind(*fields, **self.position)
+
+    def locate(self, node):
+        line = node.line
+        if line is not None and line > 0:
+            self.position = {'lineno': line, 'col_offset': node.column}
+
+    def temp(self):
+        self.temps += 1
+        return f't_{self.temps}'
+
+    def name(self, var_name, context):
+        self.names.setdefault(var_name, None)
+        return self.make(ast.Name, f'v_{var_name}', context)
+
+    def call(self, function, *arguments):
+        return self.make(ast.Call, self.make(ast.Name, function, PYTHON_LOAD), list(arguments), [])
+
+    def keep(self, value, out, keep):
+        if keep:
+            value = self.call('append', value)
+        out.append(self.make(ast.Expr, value))
+
+    def statement(self, node, out, keep):
+        self.locate(node)
+        kind = type(node)
+        if kind is WhileNode:
+            body = []
+            self.targets.append(WhileNode)
+            for child in node.body:
+                self.statement(child, body, False)
+            self.targets.pop()
+            out.append(self.make(ast.While, self.condition(node.condition), body or [self.make(ast.Pass)], []))
+            if keep:
+                self.keep(self.make(ast.Constant, None), out, True)
+        elif kind is ForNode:
+            step = node.step
+            arguments = [self.expression(node.start)[0], self.expression(node.end)[0]]
+            arguments.append(self.make(ast.Constant, 1) if step is None else self.expression(step)[0])
+            arguments.append(self.make(ast.Constant, None if step is None else step.line))
+            arguments.append(self.make(ast.Constant, None if step is None else step.column))
+            if self.resolver.creates(node):
+                arguments.append(self.make(ast.Name, 'created', PYTHON_LOAD))
+                arguments.append(self.make(ast.Constant, node.var_name.value))
+            target = self.name(node.var_name.value, PYTHON_STORE)
+            self.assigned.setdefault(node.var_name.value, None)
+            body = []
+            self.targets.append(ForNode)
+            for child in node.body:
+                self.statement(child, body, False)
+            self.targets.pop()
+            out.append(self.make(ast.For, target, self.call('for_range', *arguments), body or [self.make(ast.Pass)], []))
+            if keep:
+                self.keep(self.make(ast.Constant, None), out, True)
+        elif kind is IfNode:
+            tail = out
+            for condition, expr in node.cases:
+                test = self.condition(condition)
+                branch = []
+                self.statement(expr, branch, keep)
+                statement = self.make(ast.If, test, branch, [])
+                tail.append(statement)
+                tail = statement.orelse
+            if node.else_case:
+                self.statement(node.else_case, tail, keep)
+            elif keep:
+                self.keep(self.make(ast.Constant, None), tail, True)
+        elif kind is SwitchNode:
+            temp = self.temp()
+            out.append(self.make(ast.Assign, [self.make(ast.Name, temp, PYTHON_STORE)], self.expression(node.condition)[0]))
+            tail = out
+            self.targets.append(SwitchNode)
+            for condition, expr in node.cases:
+                case = self.expression(condition)[0]
+                test = self.make(ast.Compare, case, [PYTHON_COMPARISONS[Number.comp_eq]], [self.make(ast.Name, temp, PYTHON_LOAD)])
+                branch = []
+                self.statement(expr, branch, keep)
+                statement = self.make(ast.If, test, branch, [])
+                tail.append(statement)
+                tail = statement.orelse
+            if node.default_case != None:
+                self.statement(node.default_case, tail, keep)
+            elif keep:
+                self.keep(self.make(ast.Constant, None), tail, True)
+            self.targets.pop()
+        elif kind is BreakNode and self.targets[-1] is SwitchNode:
+            # the branch is the last thing the switch runs anyway
+            self.keep(self.make(ast.Constant, None), out, keep)
+        elif kind is BreakNode:
+            out.append(self.make(ast.Break))
+        elif kind is ContinueNode:
+            out.append(self.make(ast.Continue))
+        elif kind is VarAssignNode:
+            value = self.assigned_value(node)
+            out.append(self.make(ast.Assign, [self.assign_target(node)], value))
+            if self.resolver.creates(node):
+                created = self.make(ast.Subscript, self.make(ast.Name, 'created', PYTHON_LOAD),
+                                    self.make(ast.Constant, node.var_name.value), PYTHON_STORE)
+                out.append(self.make(ast.Assign, [created], self.make(ast.Constant, None)))
+            if keep:
+                self.keep(self.name(node.var_name.value, PYTHON_LOAD), out, True)
+        else:
+            self.keep(self.expression(node)[0], out, keep)
+
+    def assign_target(self, node):
+        self.assigned.setdefault(node.var_name.value, None)
+        return self.name(node.var_name.value, PYTHON_STORE)
+
+    def assigned_value(self, node):
+        value, optional = self.expression(node.value)
+        if optional:
+            value = self.call('check_defined', value, self.make(ast.Constant, node.var_name.value))
+        return value
+
+    def condition(self, node):
+        if type(node) is LogicalOpNode and yields_int(node.left) and yields_int(node.right):
+            # neither operand is truncated, so testing each tests the value
+            combine = ast.Or() if node.skip_when else ast.And()
+            return self.make(ast.BoolOp, combine, [self.condition(node.left), self.condition(node.right)])
+        value, optional = self.expression(node)
+        # int(a < b) tests the same as a < b, but int(a and b) truncates
+        if type(value) is ast.Call and type(value.func) is ast.Name and value.func.id == 'int' \
+                and type(value.args[0]) is ast.Compare:
+            return value.args[0]
+        if optional:
+            return self.call('condition', value)
+        return value
+
+    def expression(self, node):
+        kind = type(node)
+        if kind is NumberNode:
+            return self.make(ast.Constant, node.value), False
+        if kind is VarAccessNode:
+            return self.name(node.var_name.value, PYTHON_LOAD), False
+        if kind is VarAssignNode:
+            value = self.assigned_value(node)
+            if self.resolver.creates(node):
+                value = self.call('create', self.make(ast.Name, 'created', PYTHON_LOAD),
+                                  self.make(ast.Constant, node.var_name.value), value)
+            return self.make(ast.NamedExpr, self.assign_target(node), value), False
+        if kind is BinOpNode:
+            return self.binary(node)
+        if kind is LogicalOpNode:
+            return self.logical(node)
+        if kind is UnaryOpNode:
+            operand, optional = self.expression(node.node)
+            if node.op.type == TK_MINUS:
+                return self.make(ast.BinOp, operand, PYTHON_ARITHMETIC[Number.mul], self.make(ast.Constant, -1)), False
+            if node.op.match(TK_KEYWORD, 'not'):
+                temp = self.temp()
+                value = self.make(ast.NamedExpr, self.make(ast.Name, temp, PYTHON_STORE), operand)
+                test = self.make(ast.Compare, value, [PYTHON_COMPARISONS[Number.comp_eq]], [self.make(ast.Constant, 0)])
+                return self.make(ast.IfExp, test, self.make(ast.Constant, 1), self.make(ast.Name, temp, PYTHON_LOAD)), optional
+            return operand, optional
+        if kind is IfNode:
+            optional = not node.else_case
+            if node.else_case:
+                value, optional = self.expression(node.else_case)
+            else:
+                value = self.make(ast.Constant, None)
+            for condition, expr in reversed(node.cases):
+                branch, branch_optional = self.expression(expr)
+                value = self.make(ast.IfExp, self.condition(condition), branch, value)
+                optional |= branch_optional
+            return value, optional
+        if kind is SwitchNode:
+            optional = node.default_case == None
+            if node.default_case != None:
+                value, optional = self.expression(node.default_case)
+            else:
+                value = self.make(ast.Constant, None)
+            temp = self.temp()
+            switch = self.make(ast.NamedExpr, self.make(ast.Name, temp, PYTHON_STORE), self.expression(node.condition)[0])
+            if not node.cases:
+                pair = self.make(ast.Tuple, [switch, value], PYTHON_LOAD)
+                return self.make(ast.Subscript, pair, self.make(ast.Constant, 1), PYTHON_LOAD), optional
+            for index in range(len(node.cases) - 1, -1, -1):
+                condition, expr = node.cases[index]
+                branch, branch_optional = self.expression(expr)
+                case = self.expression(condition)[0]
+                if index == 0:
+                    # the switch value is evaluated before the first case
+                    test = self.make(ast.Compare, switch, [PYTHON_COMPARISONS[Number.comp_eq]], [case])
+                else:
+                    test = self.make(ast.Compare, case, [PYTHON_COMPARISONS[Number.comp_eq]], [self.make(ast.Name, temp, PYTHON_LOAD)])
+                value = self.make(ast.IfExp, test, branch, value)
+                optional |= branch_optional
+            return value, optional
+        if kind is BreakNode:
+            # loops are statements only, so this breaks a switch
+            return self.make(ast.Constant, None), True
+        raise TranspileError(f'{kind.__name__} cannot be transpiled inside an expression')
+
+    def binary(self, node):
+        operation = node.operation
+        left, left_optional = self.expression(node.left)
+        right, optional = self.expression(node.right)
+        if operation is Number.div and not optional:
+            divisor = node.right
+            # a None dividend must still report a zero divisor first
+            if not left_optional and divisor.line is not None and divisor.line > 0:
+                position = self.position
+                self.locate(divisor)
+                division = self.make(ast.BinOp, left, ast.Div(), right)
+                self.position = position
+                return division, False
+            line = self.make(ast.Constant, divisor.line)
+            column = self.make(ast.Constant, divisor.column)
+            return self.call('divide', left, right, line, column), False
+        if optional or operation not in PYTHON_ARITHMETIC and operation not in PYTHON_COMPARISONS:
+            return self.call('binary', self.make(ast.Constant, PYTHON_OPERATION_INDEX[operation]), left, right), True
+        if operation in PYTHON_ARITHMETIC:
+            return self.make(ast.BinOp, left, PYTHON_ARITHMETIC[operation], right), False
+        return self.call('int', self.make(ast.Compare, left, [PYTHON_COMPARISONS[operation]], [right])), False
+
+    # Python's and/or skip their right side as BASIC's do, and give the
+    # operand that decides, which is then truncated unless it is an int
+    def logical(self, node):
+        left, left_optional = self.expression(node.left)
+        right, optional = self.expression(node.right)
+        combine = ast.Or() if node.skip_when else ast.And()
+        value = self.make(ast.BoolOp, combine, [left, right])
+        if yields_int(node.left) and yields_int(node.right):
+            return value, left_optional or optional
+        if optional:
+            return self.call('truncate', value), True
+        return self.call('int', value), False
+
+
+# Runs TranspiledProgram code on the unboxed variables of NativeInterpreter.
+# Python errors raised by the generated code are turned back into the
+# interpreter's messages, and the locals the program assigned are copied
+# back into self.values whether it finished or not. Programs with a while
+# inside an expression run on the closure engine instead
+class PythonInterpreter(NativeInterpreter):
+    def execute(self, tree):
+        self.program = None
+        if isinstance(tree, TranspiledProgram):
+            self.program = tree
+        else:
+            try:
+                self.program = without_gc(Transpiler().transpile, tree)
+            except TranspileError:
+                return ClosureInterpreter.execute(self, tree)
+        return self.run_program(self.program)
+
+    def run_program(self, program):
+        function = program.function()
+        initial = {name: self.values.get(name) for name in program.assigned}
+        try:
+            result, program_locals = function(self.values)
+        except BaseException as error:
+            traceback = error.__traceback__
+            while traceback is not None and traceback.tb_frame.f_code is not function.__code__:
+                traceback = traceback.tb_next
+            if traceback is not None:
+                self.store_locals(program, traceback.tb_frame.f_locals, initial)
+            if isinstance(error, ZeroDivisionError) and 'division by zero' in str(error) and traceback is not None:
+                while traceback.tb_next is not None:
+                    traceback = traceback.tb_next
+                line, _, column, _ = list(traceback.tb_frame.f_code.co_positions())[traceback.tb_lasti // 2]
+                print(f"Division by zero At Line: {line} : Column: {column} "  )
+                exit(1)
+            if isinstance(error, NameError):
+                match = re.search(r"'v_(\w+)'", str(error))
+                if match:
+                    print(f"Undefined variable '{match.group(1)}'")
+                    exit(1)
+            raise
+        self.store_locals(program, program_locals, initial)
+        return result
+
+    def store_locals(self, program, program_locals, initial):
+        for name in [*program_locals.get('created', ()), *program.assigned]:
+            value = program_locals.get(f'v_{name}', initial[name])
+            if value is not initial[name]:
+                self.values[name] = value
+                self.assigned[name] = None
+
+
+
+ENGINES = {
+    'tree': Interpreter,
+    'stack': StackInterpreter,
+    'flat': FlatInterpreter,
+    'native': NativeInterpreter,
+    'vm': VMInterpreter,
+    'closure': ClosureInterpreter,
+    'python': PythonInterpreter,
+}
+
+
+
+global_symbol_table = Environment()
+global_symbol_table.set("nil", Number(0))
+global_symbol_table.set("true", Number(1))
+global_symbol_table.set("false", Number(0))
+
+
+BUILTIN_NAMES = ('true', 'false', 'nil')
+POW_FOLD_LIMIT = 64
+
+
+# Rewrites a parsed tree in place before it runs:
+#   constant  folds operators over literals with the interpreter's own
+#             binary_op/unary_op, except x / 0, x % 0 and x ^ n with |n| > 64
+#   builtin   replaces true/false/nil with their value in global_symbol_table
+#             when the program never assigns them
+#   mul_one   x * 1, 1 * x -> x for a literal or variable x
+#   square    x ^ 2 -> x * x for a variable x
+#   short_circuit       0 and x, 1 or x -> int() of the literal, dropping x
+# Folded literals get tokens without a line index, so a zero divisor still
+# reports the position None that a computed value reports. x * 1, +x and
+# not x (x non-zero) yield x's own Number rather than a fresh one, so they
+# are only applied where an enclosing operator consumes the value (anywhere
+# but the divisor of '/'). There is no x + 0 rule: it would keep a float
+# -0.0 that the addition turns into 0.0.
+# Expressions are walked with an explicit stack; if/switch/while recurse.
+class Optimizer:
+    def __init__(self, symbol_table=None):
+        self.symbol_table = symbol_table if symbol_table is not None else global_symbol_table
+        self.interpreter = Interpreter(None, None)
+        self.rewrites = Counter()
+        self.builtins = {}
+
+    def optimize(self, tree):
+        assigned = set()
+        work = [tree]
+        while work:
+            node = work.pop()
+            if type(node) is VarAssignNode or type(node) is ForNode:
+                assigned.add(node.var_name.value)
+            work.extend(node_children(node))
+        self.builtins = {name: self.symbol_table.vars[name].value for name in BUILTIN_NAMES
+                         if name not in assigned and name in self.symbol_table.vars}
+        return self.rewrite(tree)
+
+    def rewrite(self, node, consumed=False):
+        done = []
+        work = [(node, consumed, False)]
+        while work:
+            node, consumed, ready = work.pop()
+            kind = type(node)
+            if kind is BinOpNode or kind is LogicalOpNode:
+                if not ready:
+                    work.append((node, consumed, True))
+                    work.append((node.right, node.op.type != TK_DIV, False))
+                    work.append((node.left, True, False))
+                    continue
+                node.right = done.pop()
+                node.left = done.pop()
+                done.append(self.binary(node, consumed))
+            elif kind is UnaryOpNode:
+                if not ready:
+                    work.append((node, consumed, True))
+                    # '-' makes a new Number; '+' and 'not' may pass theirs on
+                    work.append((node.node, consumed or node.op.type == TK_MINUS, False))
+                    continue
+                node.node = done.pop()
+                done.append(self.unary(node, consumed))
+            elif kind is VarAssignNode:
+                if not ready:
+                    work.append((node, consumed, True))
+                    work.append((node.value, False, False))
+                    continue
+                node.value = done.pop()
+                done.append(node)
+            elif kind is VarAccessNode:
+                done.append(self.builtin(node))
+            else:
+                done.append(self.block(node))
+        return done[0]
+
+    def block(self, node):
+        kind = type(node)
+        if kind is ListNode:
+            node.node_list = [self.rewrite(child) for child in node.node_list]
+        elif kind is IfNode:
+            node.cases = [(self.rewrite(condition), self.rewrite(expr)) for condition, expr in node.cases]
+            if node.else_case:
+                node.else_case = self.rewrite(node.else_case)
+        elif kind is SwitchNode:
+            node.condition = self.rewrite(node.condition)
+            node.cases = [(self.rewrite(condition), self.rewrite(expr)) for condition, expr in node.cases]
+            if node.default_case != None:
+                node.default_case = self.rewrite(node.default_case)
+        elif kind is WhileNode:
+            node.condition = self.rewrite(node.condition)
+            node.body = [self.rewrite(child) for child in node.body]
+        elif kind is ForNode:
+            node.start = self.rewrite(node.start)
+            node.end = self.rewrite(node.end)
+            if node.step is not None:
+                node.step = self.rewrite(node.step)
+            node.body = [self.rewrite(child) for child in node.body]
+        return node
+
+    def constant(self, value, token, rule):
+        self.rewrites[rule] += 1
+        return NumberNode(Token(TK_INT if type(value) is int else TK_FLOAT, value, token.pos))
+
+    def builtin(self, node):
+        name = node.var_name.value
+        if name in self.builtins:
+            return self.constant(self.builtins[name], node.var_name, 'builtin')
+        return node
+
+    def unary(self, node, consumed):
+        if type(node.node) is not NumberNode:
+            return node
+        number = Number(node.node.value)
+        value = self.interpreter.unary_op(node.op, number)
+        if value is number:
+            # '+' and 'not' of non-zero hand back the operand, token and all
+            if not consumed:
+                return node
+            self.rewrites['constant'] += 1
+            return node.node
+        return self.constant(value.value, node.op, 'constant')
+
+    def binary(self, node, consumed):
+        left, op, right = node.left, node.op, node.right
+        literal_left = type(left) is NumberNode
+        literal_right = type(right) is NumberNode
+        if literal_left and type(node) is LogicalOpNode and bool(left.value) is node.skip_when:
+            return self.constant(int(left.value), op, 'short_circuit')
+        if literal_left and literal_right:
+            if op.type in (TK_DIV, TK_MOD) and right.value == 0:
+                return node
+            if op.type == TK_POW and abs(right.value) > POW_FOLD_LIMIT:
+                return node
+            try:
+                value = self.interpreter.binary_op(op, Number(left.value), Number(right.value))
+            except (ArithmeticError, ValueError):
+                return node
+            if not isinstance(value, Number):
+                return node
+            return self.constant(value.value, op, 'constant')
+
+        if op.type == TK_POW and literal_right and type(left) is VarAccessNode and is_int(right.value, 2):
+            self.rewrites['square'] += 1
+            return BinOpNode(left, Token(TK_MUL, '*', op.pos, op.lines), left)
+        if not consumed:
+            return node
+        simple_left = literal_left or type(left) is VarAccessNode
+        simple_right = literal_right or type(right) is VarAccessNode
+        if op.type == TK_MUL:
+            if literal_right and is_int(right.value, 1) and simple_left:
+                self.rewrites['mul_one'] += 1
+                return left
+            if literal_left and is_int(left.value, 1) and simple_right:
+                self.rewrites['mul_one'] += 1
+                return right
+        return node
+
+
+def is_int(value, expected):
+    return type(value) is int and value == expected
+
+
+
+INTERPRETER_VERSION = '7.0'
+CACHE_FORMAT_VERSION = 5
+
+
+# (un)pickling a tree allocates hundreds of thousands of objects that all
+# survive; collecting while it runs only rescans them
+def without_gc(fn, *args):
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return fn(*args)
+    finally:
+        if enabled:
+            gc.enable()
+
+
+# moves everything allocated so far, e.g. the closures of a compiled program,
+# out of the collector's generations while fn runs, so the collections fn
+# triggers do not rescan them each time
+def with_frozen_gc(fn, *args):
+    gc.freeze()
+    try:
+        return fn(*args)
+    finally:
+        gc.unfreeze()
+
+
+# Stands in for a parser when the tree comes from the compile cache
+class ParsedTree:
+    def __init__(self, tree):
+        self.tree = tree
+
+    def parse(self):
+        return self.tree
+
+
+# Pickled parse trees on disk, keyed by a hash of the source, the interpreter
+# version and the cache format. Hits refresh the file's mtime; after a store
+# the least recently used entries are evicted until the directory fits max_bytes
+class CompileCache:
+    def __init__(self, directory=None, max_bytes=64 << 20):
+        if directory is None:
+            directory = os.path.join(os.path.expanduser('~'), '.cache', 'basic_7')
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, text):
+        digest = hashlib.sha256(f'{INTERPRETER_VERSION}:{CACHE_FORMAT_VERSION}:'.encode('ascii'))
+        digest.update(b'b' if isinstance(text, (bytes, mmap.mmap)) else b's')
+        digest.update(text.encode('utf-8', 'surrogatepass') if isinstance(text, str) else text)
+        return digest.hexdigest()
+
+    def path(self, key, suffix='.ast'):
+        return os.path.join(self.directory, key + suffix)
+
+    # transpiled programs are marshalled code objects, which only load on
+    # the Python version that wrote them; those of optimized trees are kept
+    # apart from the others
+    def program_path(self, text, optimized=False):
+        tag = sys.implementation.cache_tag
+        return self.path(f'{self.key(text)}-{"opt-" if optimized else ""}{tag}', '.code')
+
+    # get() and get_program() count a hit or a miss; load_tree() does not,
+    # for a lookup that only backs up one already counted
+    def get(self, text):
+        return self.count(self.load_tree(text))
+
+    def get_program(self, text, optimized=False):
+        return self.count(self.load(self.program_path(text, optimized), TranspiledProgram.from_bytes))
+
+    def load_tree(self, text):
+        return self.load(self.path(self.key(text)), pickle.loads)
+
+    def count(self, value):
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def load(self, path, decode):
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            value = without_gc(decode, data)
+        except Exception:
+            # truncated entry or a tree from another build of the classes
+            self.discard(path)
+            return None
+        os.utime(path)
+        return value
+
+    def put(self, text, tree):
+        try:
+            data = without_gc(pickle.dumps, tree, pickle.HIGHEST_PROTOCOL)
+        except RecursionError:
+            return False
+        return self.store(self.path(self.key(text)), data)
+
+    def put_program(self, text, program, optimized=False):
+        return self.store(self.program_path(text, optimized), program.to_bytes())
+
+    def store(self, path, data):
+        if len(data) > self.max_bytes:
+            return False
+        fd, temp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(temp, path)
+        self.evict()
+        return True
+
+    def entries(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(('.ast', '.code')):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            self.discard(path)
+            total -= size
+
+    def discard(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        for _, _, path in self.entries():
+            self.discard(path)
+
+
+def run(text, lexer='char', stream=False, parser='recursive', engine='tree', cache=None, optimizer=None):
+    optimized = optimizer is not None
+    program = cache.get_program(text, optimized) if cache is not None and engine == 'python' else None
+    if cache is None or program is not None:
+        tree = None
+    elif engine == 'python':
+        # a run counts one lookup, and this one's miss already is
+        tree = cache.load_tree(text)
+    else:
+        tree = cache.get(text)
+    if program is not None:
+        parser = ParsedTree(program)
+    elif tree is not None:
+        parser = ParsedTree(tree)
+    else:
+        source = BytesLexer.as_text(text) if lexer == 'bytes' else None
+        if source is not None:
+            lexer = RegexLexer(source)
+        else:
+            lexer = LEXERS[lexer](text)
+        if stream:
+            tokens = lexer.tokens()
+        else:
+            tokens = lexer.get_next_token()
+        parser = PARSERS[parser](tokens)
+        if cache is not None:
+            tree = parser.parse()
+            cache.put(text, tree)
+            parser = ParsedTree(tree)
+    if optimizer is not None and program is None:
+        parser = ParsedTree(optimizer.optimize(parser.parse()))
+    
+    context = Context('<program>')
+    context.symbol_table = global_symbol_table
+
+
+    interpreter = ENGINES[engine](parser, context)
+    re = interpreter.interpret()
+    if cache is not None and program is None and getattr(interpreter, 'program', None) is not None:
+        cache.put_program(text, interpreter.program, optimized)
+    return re
+
+
+def run_file(path, lexer='char', **options):
+    return run(read_source(path, use_mmap=lexer == 'bytes'), lexer=lexer, **options)
+
+
+def generate_program(lines):
+    source = []
+    for i in range(lines):
+        kind = i % 4
+        if kind == 0:
+            source.append(f'var a{i} = ({i} + 3.5) * 2 ^ 2 - {i} % 7')
+        elif kind == 1:
+            source.append(f'if ({i} <= a{i - 1}) then var b{i} = 2 * a{i - 1} div 2 else b{i} = 0 endif')
+        elif kind == 2:
+            source.append(f'switch (b{i - 1}) case 1: 1 case 2: 2 default: c{i} = {i} endswitch')
+        else:
+            source.append(f'var d{i} = not ({i} != a{i - 3}) and (100 >= a{i - 3} or false)')
+    return '\n'.join(source) + '\n'
+
+
+def test_calculator():
+    test_cases = [
+        # Testing precedence of operations
+        ("3 + 2 * 5", 13),
+        ("3 * 2 ^ 2", 12),
+        ("(3 + 2) * 5", 25),
+        ("(3 * 2) ^ 2", 36),
+
+        # Testing float numbers
+        ("3.2 + 2.8", 6.0),
+        ("5.5 * 2", 11.0),
+        ("6.25 / 2.5", 2.5),
+        ("8.9 - 2.9", 6.0),
+        ("10.75 % 3.5", 0.25),
+
+        # Testing negative numbers
+        ("-2 + 3", 1),
+        ("3 * -2", -6),
+        ("-2 ^ 3", -8),
+        ("10 / -2", -5),
+        ("-10 - -5", -5),
+        ("10 % -3", -2),
+
+        # Testing nested expressions
+        ("(3 + (2 * 5)) - (2 * (2 + 3))", 3),
+        ("((3 ^ 2) - 4) * 2", 10),
+        ("((12 / 2) + 5) * 2", 22),
+        ("((7 + 3) % 4) * 5", 10),
+        ("(2 ^ (2 + 1)) * 2", 16),
+
+        # Testing and/or
+        ("0 and (1 / 0)", 0),
+        ("1 or (1 / 0)", 1),
+        ("if (0.5 or (1 == 2)) then 1 else 2 endif", 2),
+        ("if ((1 == 1) and 0.5) then 1 else 2 endif", 2),
+
+        # Testing a condition that is None, which stops every engine
+        ("var x = 0 while (if (x < 3) then 1 endif) then x = x + 1 endwhile", AttributeError),
+    ]
+
+    modes = [(name, parser_class, Interpreter) for name, parser_class in PARSERS.items()]
+    modes += [(f'{name} engine', Parser, engine_class) for name, engine_class in ENGINES.items() if engine_class is not Interpreter]
+    for name, parser_class, engine_class in modes:
+        for i, (text, expected) in enumerate(test_cases):
+            lexer = Lexer(text)
+            tokens = lexer.get_next_token()
+            parser = parser_class(tokens)
+            context = Context('<test>')
+            context.symbol_table = Environment(global_symbol_table)
+            interpreter = engine_class(parser, context)
+            if isinstance(expected, type):
+                try:
+                    interpreter.interpret()
+                except expected:
+                    print(f"{name}: Test case {i+1} passed.")
+                else:
+                    print(f"{name}: Test case {i+1} ({text}) failed: expected {expected.__name__}")
+                continue
+            result = interpreter.interpret()[0]
+            if (result.value != expected):
+                print(f"{name}: Test case {i+1} ({text}) failed: got {result.value}, expected {expected}")
+                continue
+            print(f"{name}: Test case {i+1} passed.")
+
+
+def best_time(fn, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+# runs tree, or a FlatAST or Bytecode made from one, on engine in a fresh
+# scope under outer
+def evaluate_tree(engine, tree, outer=global_symbol_table):
+    context = Context('<bench>')
+    context.symbol_table = Environment(outer)
+    return ENGINES[engine](ParsedTree(tree), context).interpret()
+
+
+def bench_lexers(lines=50000):
+    text = generate_program(lines)
+    reference = [(t.type, t.value, t.line, t.column) for t in Lexer(text).get_next_token()]
+    print(f'{lines} lines, {len(text)} chars, {len(reference)} tokens')
+    for name, lexer_class in LEXERS.items():
+        tokens = lexer_class(text).get_next_token()
+        same = [(t.type, t.value, t.line, t.column) for t in tokens] == reference
+        elapsed = best_time(lambda: lexer_class(text).get_next_token(), repeat=3)
+        print(f'  {name:8} {elapsed * 1000:9.1f} ms  {len(reference) / elapsed:12.0f} tokens/s  same={same}')
+
+
+def peak_memory(fn):
+    tracemalloc.start()
+    try:
+        result = fn()
+        return result, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def retained_memory(fn):
+    tracemalloc.start()
+    try:
+        result = fn()
+        return result, tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_token_memory(lines=20000):
+    text = generate_program(lines)
+    tokens, token_bytes = retained_memory(lambda: RegexLexer(text).get_next_token())
+    buffer, buffer_bytes = retained_memory(lambda: CompactLexer(text).get_next_token())
+    count = len(tokens)
+    same = [(t.type, t.value, t.line, t.column) for t in tokens] == [
+        (t.type, t.value, t.line, t.column) for t in buffer]
+    print(f'{lines} lines, {count} tokens, same={same}')
+    print(f'  Token list   {token_bytes / count:7.1f} bytes/token')
+    print(f'  TokenBuffer  {buffer_bytes / count:7.1f} bytes/token  ({buffer.nbytes() / count:.1f} in arrays and values)')
+
+
+def bench_mmap(lines=100000):
+    fd, path = tempfile.mkstemp(suffix='.bas')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(generate_program(lines))
+        print(f'{lines} lines, {os.path.getsize(path)} bytes on disk')
+        for name in ('char', 'regex', 'bytes'):
+            def lex():
+                count = 0
+                for token in LEXERS[name](read_source(path, use_mmap=name == 'bytes')).tokens():
+                    count += 1
+                return count
+            count, peak = peak_memory(lex)
+            elapsed = best_time(lex, repeat=1)
+            print(f'  {name:8} peak {peak / 1024 / 1024:8.1f} MiB  {elapsed * 1000:9.1f} ms  {count} tokens')
+    finally:
+        os.remove(path)
+
+
+def bench_parsers(lines=20000):
+    source = []
+    for i in range(lines):
+        source.append(f'var x{i} = (1 + 2 * 3 - 4 / 5) ^ 2 % 7 + -8 * (9 - {i}) >= 2 ^ -3 ^ 2 and not x{i - 1} < 5 or 6 div 3')
+    text = '\n'.join(source) + '\n'
+    tokens = CompactLexer(text).get_next_token()
+    tokens = [tokens[i] for i in range(len(tokens))]
+    reference = repr(Parser(tokens).parse().node_list)
+    print(f'{lines} lines, {len(tokens)} tokens')
+    for name, parser_class in PARSERS.items():
+        same = repr(parser_class(tokens).parse().node_list) == reference
+        elapsed = best_time(lambda: parser_class(tokens).parse(), repeat=3)
+        print(f'  {name:10} {elapsed * 1000:9.1f} ms  {len(tokens) / elapsed:12.0f} tokens/s  same={same}')
+
+
+def bench_parallel(lines=200000):
+    text = generate_program(lines)
+    reference = CompactLexer(text).get_next_token()
+    sequential = best_time(lambda: CompactLexer(text).get_next_token(), repeat=3)
+    print(f'{lines} lines, {len(reference)} tokens, {os.cpu_count()} cores')
+    print(f'  sequential      {sequential * 1000:9.1f} ms')
+    workers = 1
+    while workers <= (os.cpu_count() or 1) * 2:
+        lexer = ParallelLexer(text, workers)
+        buffer = lexer.get_next_token()
+        same = (buffer.kinds == reference.kinds and buffer.starts == reference.starts
+                and buffer.ends == reference.ends and buffer.values == reference.values)
+        elapsed = best_time(lambda: ParallelLexer(text, workers).get_next_token(), repeat=3)
+        print(f'  {workers:2} workers      {elapsed * 1000:9.1f} ms  x{sequential / elapsed:5.2f}  same={same}')
+        workers *= 2
+
+
+def bench_identifiers(lines=50000):
+    source = []
+    for i in range(lines):
+        source.append(f'var total_{i % 97} = count_{i % 89} * weight_{i % 83} + offset_{i % 79} and Flag_{i % 7} or nil')
+    text = '\n'.join(source) + '\n'
+    names = [t.value for t in RegexLexer(text).get_next_token() if t.type in (TK_IDENTIFIER, TK_KEYWORD)]
+    print(f'{lines} lines, {len(names)} identifiers and keywords')
+
+    def classify_list():
+        for id_str in names:
+            if id_str in KEYWORDS:
+                if id_str == 'div':
+                    kind = TK_DIV
+                elif id_str == 'mod':
+                    kind = TK_MOD
+                else:
+                    kind = TK_KEYWORD
+            else:
+                kind = TK_IDENTIFIER
+
+    def classify_table():
+        get = KEYWORD_KINDS.get
+        for id_str in names:
+            kind = get(id_str, TK_IDENTIFIER)
+
+    print(f'  keyword list scan    {best_time(classify_list) * 1000:9.1f} ms')
+    print(f'  keyword table        {best_time(classify_table) * 1000:9.1f} ms')
+
+    environment = Environment()
+    for id_str in set(names):
+        environment.set(sys.intern(id_str), Number(0))
+    copies = [id_str[:1] + id_str[1:] for id_str in names]
+
+    def lookup(keys):
+        get = environment.get
+        for id_str in keys:
+            get(id_str)
+
+    print(f'  env.get, fresh str   {best_time(lambda: lookup(copies)) * 1000:9.1f} ms')
+    print(f'  env.get, interned    {best_time(lambda: lookup(names)) * 1000:9.1f} ms')
+    print(f'  regex lexer          {best_time(lambda: RegexLexer(text).get_next_token(), repeat=3) * 1000:9.1f} ms')
+
+
+def bench_incremental(lines=20000, edits=200):
+    text = generate_program(lines)
+    document = IncrementalParser(text)
+    full = best_time(lambda: Parser(RegexLexer(document.text).get_next_token()).parse(), repeat=1)
+    middle = len(text) // 2
+    start = time.perf_counter()
+    for i in range(edits):
+        at = text.index('+ 3.5', middle + i * 50)
+        document.edit(at, at + 5, '+ 4.5')
+    per_edit = (time.perf_counter() - start) / edits
+    same = repr(document.parse().node_list) == repr(Parser(RegexLexer(document.text).get_next_token()).parse().node_list)
+    print(f'{lines} lines, {len(document.chunks)} statements')
+    print(f'  full re-parse     {full * 1000:9.2f} ms')
+    print(f'  incremental edit  {per_edit * 1000:9.2f} ms  ({document.reparsed} statements, {document.lexed} tokens re-lexed)  same={same}')
+
+
+def bench_stream(lines=20000):
+    text = generate_program(lines)
+    print(f'{lines} lines, {len(text)} chars')
+    for name in LEXERS:
+        for stream in (False, True):
+            def parse():
+                lexer = LEXERS[name](text)
+                tokens = lexer.tokens() if stream else lexer.get_next_token()
+                return Parser(tokens).parse()
+            _, peak = peak_memory(parse)
+            elapsed = best_time(parse, repeat=3)
+            mode = 'stream' if stream else 'list'
+            print(f'  {name:8} {mode:8} peak {peak / 1024 / 1024:8.1f} MiB  {elapsed * 1000:9.1f} ms')
+
+
+def bench_depth(depth=100000, terms=20000, lines=20000):
+    cases = [
+        (f'{depth} nested parens', '(' * depth + '1' + ')' * depth + '\n'),
+        (f'{depth} unary minus', '- ' * depth + '1\n'),
+        (f'{terms} term chain', 'var a = 1\n' + ' + '.join(['a'] * terms) + '\n'),
+    ]
+    for label, text in cases:
+        tokens = RegexLexer(text).get_next_token()
+        print(label)
+        for name, parser_class in PARSERS.items():
+            for engine, engine_class in ENGINES.items():
+                context = Context('<bench>')
+                context.symbol_table = Environment(global_symbol_table)
+                try:
+                    result = engine_class(parser_class(tokens), context).interpret()[-1]
+                except RecursionError:
+                    result = 'RecursionError'
+                print(f'  {name:10} {engine:6} {result}')
+
+    text = generate_program(lines)
+    tokens = RegexLexer(text).get_next_token()
+    print(f'{lines} lines, {len(tokens)} tokens')
+    for name, parser_class in PARSERS.items():
+        elapsed = best_time(lambda: parser_class(tokens).parse(), repeat=3)
+        print(f'  parse {name:10} {elapsed * 1000:9.1f} ms')
+    tree = Parser(tokens).parse()
+    for engine in ENGINES:
+        elapsed = best_time(lambda: evaluate_tree(engine, tree), repeat=3)
+        print(f'  eval  {engine:10} {elapsed * 1000:9.1f} ms')
+
+
+def bench_cache(lines=20000):
+    text = generate_program(lines)
+    directory = tempfile.mkdtemp()
+    try:
+        cache = CompileCache(directory)
+        reference = repr(run(text))
+
+        def cold():
+            cache.clear()
+            return run(text, cache=cache)
+
+        cold_time = best_time(cold, repeat=3)
+        warm_time = best_time(lambda: run(text, cache=cache), repeat=3)
+        same = repr(run(text, cache=cache)) == reference
+        uncached = best_time(lambda: run(text), repeat=3)
+        print(f'{lines} lines, {len(text)} chars, entry {cache.size() / 1024:.0f} KiB')
+        print(f'  no cache  {uncached * 1000:9.1f} ms')
+        print(f'  cold      {cold_time * 1000:9.1f} ms')
+        print(f'  warm      {warm_time * 1000:9.1f} ms  x{uncached / warm_time:5.2f}  same={same}')
+        print(f'  hits {cache.hits}, misses {cache.misses}')
+
+        small = CompileCache(directory, max_bytes=cache.size() * 2)
+        for i in range(5):
+            run(generate_program(lines // 10 + i), cache=small)
+        print(f'  cap {small.max_bytes / 1024:.0f} KiB: {len(small.entries())} entries, {small.size() / 1024:.0f} KiB kept')
+    finally:
+        for entry in os.scandir(directory):
+            os.remove(entry.path)
+        os.rmdir(directory)
+
+
+def bench_flat(lines=20000):
+    text = generate_program(lines)
+    tree, tree_bytes = retained_memory(lambda: Parser(RegexLexer(text).get_next_token()).parse())
+    flat, flat_bytes = retained_memory(lambda: FlatAST.from_tree(tree))
+    data = flat.to_bytes()
+    same = FlatAST.from_bytes(data).kinds == flat.kinds
+    print(f'{lines} lines, {len(flat)} nodes')
+    print(f'  tree   {tree_bytes / len(flat):7.1f} bytes/node (tokens and line index included)')
+    print(f'  flat   {flat_bytes / len(flat):7.1f} bytes/node  ({flat.nbytes() / len(flat):.1f} in arrays and constants)')
+    print(f'  to_bytes {len(data) / 1024:.0f} KiB, round trip same={same}')
+    for engine, source in (('tree', tree), ('flat', flat)):
+        elapsed = best_time(lambda: evaluate_tree(engine, source), repeat=3)
+        print(f'  eval {engine:6} {elapsed * 1000:9.1f} ms')
+
+
+def bench_optimizer(lines=20000):
+    source = ['var x = 3']
+    for i in range(lines):
+        source.append(f'var k{i} = (2 ^ (2 + 1)) * 2 + x * 1 - (true + 0) * 3 ^ 2 + x ^ 2 + (0 + x) * {i % 10} / (nil + 4)')
+    text = '\n'.join(source) + '\n'
+    tokens = RegexLexer(text).get_next_token()
+    parse_time = best_time(lambda: Parser(tokens).parse(), repeat=3)
+    trees = [Parser(tokens).parse() for _ in range(3)]
+    optimize_time = best_time(lambda: Optimizer().optimize(trees.pop()), repeat=3)
+    print(f'{lines} lines, parse {parse_time * 1000:.1f} ms, optimize {optimize_time * 1000:.1f} ms')
+    optimizer = Optimizer()
+    reference = None
+    for label, tree in (('plain', Parser(tokens).parse()), ('optimized', optimizer.optimize(Parser(tokens).parse()))):
+        for engine, source in (('tree', tree), ('flat', FlatAST.from_tree(tree))):
+            result = repr(evaluate_tree(engine, source))
+            reference = reference or result
+            elapsed = best_time(lambda: evaluate_tree(engine, source), repeat=3)
+            print(f'  {label:10} {engine:6} {elapsed * 1000:9.1f} ms  same={result == reference}')
+    print(f'  rewrites {dict(optimizer.rewrites)}')
+
+
+def bench_dispatch(lines=20000):
+    class GetattrInterpreter(Interpreter):
+        def visit(self, node):
+            method_name = f'visit_{type(node).__name__}'
+            method = getattr(self, method_name)
+            return method(node)
+
+    tree = Parser(RegexLexer(generate_program(lines)).get_next_token()).parse()
+    nodes = 0
+    work = [tree]
+    while work:
+        nodes += 1
+        work.extend(node_children(work.pop()))
+    leaves = [NumberNode(Token(TK_INT, i, 0)) for i in range(nodes)]
+    print(f'{lines} lines, {nodes} nodes')
+    for name, interpreter_class in (('getattr', GetattrInterpreter), ('table', Interpreter)):
+        def evaluate():
+            context = Context('<bench>')
+            context.symbol_table = Environment(global_symbol_table)
+            return interpreter_class(None, context).visit(tree)
+        interpreter = interpreter_class(None, None)
+
+        def visit_leaves():
+            visit = interpreter.visit
+            for leaf in leaves:
+                visit(leaf)
+        program = best_time(evaluate, repeat=5)
+        leaf = best_time(visit_leaves, repeat=5)
+        print(f'  {name:8} program {program * 1000:8.1f} ms  {program / nodes * 1e9:6.0f} ns/node'
+              f'   leaf visit {leaf / nodes * 1e9:6.0f} ns')
+
+
+def bench_operators(lines=20000):
+    source = ['var a = 3', 'var b = 4']
+    for i in range(lines):
+        source.append(f'a >= b or a <= b and a != b or a == {i} and a > b or a < b')
+    tree = Parser(RegexLexer('\n'.join(source) + '\n').get_next_token()).parse()
+    operations = lines * 9
+
+    def evaluate():
+        context = Context('<bench>')
+        context.symbol_table = Environment(global_symbol_table)
+        return Interpreter(None, context).visit(tree)
+    elapsed = best_time(evaluate, repeat=5)
+    print(f'{lines} lines, {operations} binary operations')
+    print(f'  tree  {elapsed * 1000:8.1f} ms  {elapsed / operations * 1e9:6.0f} ns/operation')
+
+
+def count_numbers(fn):
+    created = 0
+    init = Number.__init__
+
+    def counting_init(self, value, token=None):
+        nonlocal created
+        created += 1
+        init(self, value, token)
+    Number.__init__ = counting_init
+    try:
+        result = fn()
+    finally:
+        Number.__init__ = init
+    return result, created
+
+
+def bench_native(lines=20000):
+    source = ['var a = 1', 'var b = 2.5']
+    for i in range(lines):
+        source.append(f'a = (a * 3 + {i % 7}) % 1000 - a div 4 + (a >= 10) * 2 - b ^ 2 + b * b')
+    tree = Parser(RegexLexer('\n'.join(source) + '\n').get_next_token()).parse()
+    reference = None
+    print(f'{lines} lines of arithmetic')
+    for engine in ('tree', 'stack', 'native'):
+        result, created = count_numbers(lambda: evaluate_tree(engine, tree))
+        reference = reference or repr(result)
+        elapsed = best_time(lambda: evaluate_tree(engine, tree), repeat=3)
+        print(f'  {engine:8} {elapsed * 1000:9.1f} ms  {created:9} Numbers  same={repr(result) == reference}')
+
+
+def bench_vm(lines=20000):
+    source = ['var a = 1', 'var b = 2.5']
+    for i in range(lines):
+        source.append(f'a = (a * 3 + {i % 7}) % 1000 - a div 4 + (a >= 10) * 2 - b ^ 2 + b * b')
+        source.append(f'if (a < 500) then b = b + 1 else switch (a % 3) case 0: b = b - 1 default: b endswitch endif')
+    tree = Parser(RegexLexer('\n'.join(source) + '\n').get_next_token()).parse()
+    defined = {name: value.value for name, value in global_symbol_table.vars.items()}
+    bytecode = Compiler(Resolver(defined).resolve(tree)).compile(tree)
+    compile_time = best_time(lambda: without_gc(Compiler(Resolver(defined).resolve(tree)).compile, tree), repeat=3)
+    print(f'{lines * 2} lines, {len(bytecode.code) // 2} instructions, compile {compile_time * 1000:.1f} ms')
+    reference = None
+    for engine, source in (('tree', tree), ('native', tree), ('vm', bytecode)):
+        result = repr(evaluate_tree(engine, source))
+        reference = reference or result
+        elapsed = best_time(lambda: evaluate_tree(engine, source), repeat=3)
+        print(f'  {engine:8} {elapsed * 1000:9.1f} ms  same={result == reference}')
+
+
+def bench_slots(lines=20000, depth=8):
+    source = ['var t = 0', 'var u = 0']
+    for i in range(lines):
+        source.append(f'var t = (t + a * b - c) % 1000 + d div 2 - e')
+        source.append(f'if (t > {i % 500}) then var u = t - a else var u = u + e endif')
+    tree = Parser(RegexLexer('\n'.join(source) + '\n').get_next_token()).parse()
+    # a, b, c, d and e live in outer scopes, so the tree walker reads them through parent links
+    outer = global_symbol_table
+    for level in range(depth):
+        outer = Environment(outer)
+        if level < 5:
+            outer.set('abcde'[level], Number(level + 2))
+    values = {}
+    environment = outer
+    while environment is not None:
+        for name, value in environment.vars.items():
+            values.setdefault(name, value.value)
+        environment = environment.parent
+    resolver = Resolver(values).resolve(tree)
+    states = Counter()
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if type(node) is VarAccessNode:
+            states[resolver.state(node)] += 1
+        stack.extend(node_children(node))
+    print(f'{lines * 2} lines, {depth} scopes, {len(resolver.slots)} slots, reads: {states[RESOLVED_DEFINED]} plain, '
+          f'{states[RESOLVED_UNKNOWN]} checked, {states[RESOLVED_UNDEFINED]} undefined')
+    reference = None
+    for engine in ('tree', 'native', 'vm', 'closure'):
+        result = repr(evaluate_tree(engine, tree, outer))
+        reference = reference or result
+        elapsed = best_time(lambda: evaluate_tree(engine, tree, outer), repeat=3)
+        print(f'  {engine:8} {elapsed * 1000:9.1f} ms  same={result == reference}')
+
+
+def bench_inline(lines=20000):
+    source = ['var t = 0', 'var u = 0']
+    for i in range(lines):
+        source.append(f'var t = (t + a * b - c) % 1000 + d div 2 - e')
+        source.append(f'if (t > {i % 500}) then var u = t - a else var u = u + e endif')
+    tree = Parser(RegexLexer('\n'.join(source) + '\n').get_next_token()).parse()
+    for depth in (1, 8, 32):
+        # a..e in the outermost scopes, under depth - 5 empty ones
+        outer = global_symbol_table
+        for level in range(max(depth, 5)):
+            outer = Environment(outer)
+            if level < 5:
+                outer.set('abcde'[level], Number(level + 2))
+        reads = []
+
+        def get_all():
+            environment = Environment(outer)
+            for name in 'abcde' * lines:
+                reads.append(environment.get(name))
+            reads.clear()
+        get_time = best_time(get_all, repeat=3)
+        print(f'{max(depth, 5)} scopes: {lines * 5} Environment.get calls {get_time * 1000:8.1f} ms')
+        for engine in ('tree', 'stack', 'flat'):
+            elapsed = best_time(lambda: evaluate_tree(engine, tree, outer), repeat=3)
+            print(f'  {engine:8} {elapsed * 1000:9.1f} ms')
+
+
+def bench_closure(lines=20000):
+    source = ['var a = 1', 'var b = 2.5']
+    for i in range(lines):
+        source.append(f'a = (a * 3 + {i % 7}) % 1000 - a div 4 + (a >= 10) * 2 - b ^ 2 + b * b')
+        source.append(f'if (a < 500) then b = b + 1 else switch (a % 3) case 0: b = b - 1 default: b endswitch endif')
+    tree = Parser(RegexLexer('\n'.join(source) + '\n').get_next_token()).parse()
+    values = {name: value.value for name, value in global_symbol_table.vars.items()}
+    resolver = Resolver(values).resolve(tree)
+    compile_time = best_time(lambda: without_gc(ClosureCompiler(Resolver(values).resolve(tree)).compile, tree), repeat=3)
+    print(f'{lines * 2} lines, closure compile {compile_time * 1000:.1f} ms')
+    reference = None
+    for engine in ('tree', 'native', 'closure'):
+        result = repr(evaluate_tree(engine, tree))
+        reference = reference or result
+        elapsed = best_time(lambda: evaluate_tree(engine, tree), repeat=3)
+        print(f'  {engine:8} {elapsed * 1000:9.1f} ms  same={result == reference}')
+
+    program = ClosureCompiler(resolver).compile(tree)
+
+    def run_closures():
+        return program([values.get(name) for name in resolver.slots])
+    elapsed = best_time(run_closures, repeat=3)
+    print(f'  closure calls only {elapsed * 1000:9.1f} ms')
+
+
+def bench_python(lines=20000):
+    source = ['var a = 1', 'var b = 2.5']
+    for i in range(lines):
+        source.append(f'a = (a * 3 + {i % 7}) % 1000 - a div 4 + (a >= 10) * 2 - b ^ 2 + b * b')
+        source.append(f'if (a < 500) then b = b + 1 else switch (a % 3) case 0: b = b - 1 default: b endswitch endif')
+    text = '\n'.join(source) + '\n'
+    tree = Parser(RegexLexer(text).get_next_token()).parse()
+    transpile_time = best_time(lambda: without_gc(Transpiler().transpile, tree), repeat=3)
+    values = {name: value.value for name, value in global_symbol_table.vars.items()}
+    closure_time = best_time(lambda: without_gc(ClosureCompiler(Resolver(values).resolve(tree)).compile, tree), repeat=3)
+    print(f'{lines * 2} lines, transpile {transpile_time * 1000:.1f} ms, closure compile {closure_time * 1000:.1f} ms')
+    reference = None
+    for engine in ('native', 'closure', 'python'):
+        result = repr(evaluate_tree(engine, tree))
+        reference = reference or result
+        elapsed = best_time(lambda: evaluate_tree(engine, tree), repeat=3)
+        print(f'  {engine:8} {elapsed * 1000:9.1f} ms  same={result == reference}')
+
+    program = Transpiler().transpile(tree)
+    function = program.function()
+
+    def run_program():
+        values = {name: value.value for name, value in global_symbol_table.vars.items()}
+        return function(values)
+    elapsed = best_time(run_program, repeat=3)
+    print(f'  python code only {elapsed * 1000:9.1f} ms')
+
+    directory = tempfile.mkdtemp()
+    try:
+        cache = CompileCache(directory)
+
+        def cold():
+            cache.clear()
+            return run(text, lexer='regex', engine='python', cache=cache)
+
+        cold_time = best_time(cold, repeat=3)
+        warm_time = best_time(lambda: run(text, lexer='regex', engine='python', cache=cache), repeat=3)
+        print(f'  run() cold {cold_time * 1000:9.1f} ms, from cached code {warm_time * 1000:9.1f} ms')
+    finally:
+        for entry in os.scandir(directory):
+            os.remove(entry.path)
+        os.rmdir(directory)
+
+
+# loop kernels for bench_loops: name -> (source, iterations of the innermost body)
+LOOP_KERNELS = {
+    'count': ('var i = 0\nwhile (i < {n}) then\n  var i = i + 1\nendwhile\ni\n', lambda n: n),
+    'sum': ('var i = 0\nvar s = 0\nwhile (i < {n}) then\n  var s = s + i * i % 7\n  var i = i + 1\nendwhile\ns\n',
+            lambda n: n),
+    'branch': ('var i = 0\nvar odd = 0\nwhile (i < {n}) then\n'
+               '  if (i % 2 == 1) then var odd = odd + 1 else var odd = odd - 1 endif\n'
+               '  var i = i + 1\nendwhile\nodd\n', lambda n: n),
+    'nested': ('var i = 0\nvar s = 0\nwhile (i < {m}) then\n  var j = 0\n'
+               '  while (j < {m}) then\n    var s = s + j\n    var j = j + 1\n  endwhile\n'
+               '  var i = i + 1\nendwhile\ns\n', lambda n: round(n ** 0.5) ** 2),
+}
+
+
+KERNEL_ENGINES = ['tree', 'stack', 'flat', 'native', 'vm', 'closure', 'python']
+
+
+def kernel_header(width):
+    print(f'{"kernel":{width}} ' + ' '.join(f'{engine:>9}' for engine in KERNEL_ENGINES) + '   (thousand iterations/s)')
+
+
+# one row of a kernel table: the thousand iterations/s of each engine on the
+# kernel's tree, after checking they agree on its last value
+def kernel_row(label, width, tree, iterations):
+    rates = []
+    results = set()
+    for engine in KERNEL_ENGINES:
+        results.add(repr(evaluate_tree(engine, tree)[-1]))
+        rates.append(iterations / best_time(lambda: evaluate_tree(engine, tree), repeat=3) / 1000)
+    if len(results) > 1:
+        print(f'  engines disagree: {sorted(results)}')
+    print(f'{label:{width}} ' + ' '.join(f'{rate:9.0f}' for rate in rates))
+
+
+def bench_loops(iterations=20000):
+    kernel_header(8)
+    for name, (template, count) in LOOP_KERNELS.items():
+        text = template.format(n=iterations, m=round(iterations ** 0.5))
+        kernel_row(name, 8, Parser(RegexLexer(text).get_next_token()).parse(), count(iterations))
+
+
+# the for-loop counterparts of LOOP_KERNELS, whose counter the engine keeps
+FOR_KERNELS = {
+    'count': 'var i = 0\nfor i = 1 to {n}\nendfor\ni\n',
+    'sum': 'var s = 0\nfor i = 0 to {n} - 1\n  var s = s + i * i % 7\nendfor\ns\n',
+    'nested': 'var s = 0\nfor i = 1 to {m}\n  for j = 0 to {m} - 1\n    var s = s + j\n  endfor\nendfor\ns\n',
+}
+
+
+def bench_for(iterations=20000):
+    kernel_header(13)
+    for name, template in FOR_KERNELS.items():
+        loop_template, count = LOOP_KERNELS[name]
+        for kind, text in (('while', loop_template), ('for', template)):
+            text = text.format(n=iterations, m=round(iterations ** 0.5))
+            kernel_row(f'{name} {kind}', 13, Parser(RegexLexer(text).get_next_token()).parse(), count(iterations))
+
+
+# loops left early by break or continue, each with a structured equivalent:
+# a flag in the loop condition, an if around the rest of the body
+JUMP_KERNELS = {
+    'exit': ('var s = 0\nfor k = 1 to {n}\n  var j = 0\n  while (1) then\n    var j = j + 1\n'
+             '    if (j >= 4) then break endif\n  endwhile\n  var s = s + j\nendfor\ns\n',
+             'var s = 0\nfor k = 1 to {n}\n  var j = 0\n  var done = 0\n  while (done == 0) then\n'
+             '    var j = j + 1\n    if (j >= 4) then var done = 1 endif\n  endwhile\n  var s = s + j\nendfor\ns\n'),
+    'skip': ('var s = 0\nfor i = 1 to {n}\n  if (i % 3 == 0) then continue endif\n  var s = s + i\nendfor\ns\n',
+             'var s = 0\nfor i = 1 to {n}\n  if (i % 3 != 0) then var s = s + i endif\nendfor\ns\n'),
+}
+
+
+def bench_jumps(iterations=20000):
+    kernel_header(16)
+    for name, texts in JUMP_KERNELS.items():
+        for kind, text in zip(('jump', 'structured'), texts):
+            tree = Parser(RegexLexer(text.format(n=iterations)).get_next_token()).parse()
+            kernel_row(f'{name} {kind}', 16, tree, iterations)
+
+
+# guard conditions whose left operand protects or spares the right one, each
+# with the same test written as nested ifs
+LOGIC_KERNELS = {
+    'guard': ('var s = 0\nfor i = 1 to {n}\n  var d = i % 4\n'
+              '  if ((d != 0) and (100 / d > 40)) then var s = s + 1 endif\nendfor\ns\n',
+              'var s = 0\nfor i = 1 to {n}\n  var d = i % 4\n'
+              '  if (d != 0) then if (100 / d > 40) then var s = s + 1 endif endif\nendfor\ns\n'),
+    'default': ('var s = 0\nfor i = 1 to {n}\n  var d = i % 4\n'
+                '  if ((d == 0) or (100 / d < 40)) then var s = s + 1 endif\nendfor\ns\n',
+                'var s = 0\nfor i = 1 to {n}\n  var d = i % 4\n'
+                '  if (d == 0) then var s = s + 1 elif (100 / d < 40) then var s = s + 1 endif\nendfor\ns\n'),
+    'rare': ('var s = 0\nfor i = 1 to {n}\n'
+             '  if ((i % 10 == 0) and ((i * i + 3 * i) % 7 == 3)) then var s = s + 1 endif\nendfor\ns\n',
+             'var s = 0\nfor i = 1 to {n}\n'
+             '  if (i % 10 == 0) then if ((i * i + 3 * i) % 7 == 3) then var s = s + 1 endif endif\nendfor\ns\n'),
+}
+
+
+def bench_logic(iterations=20000):
+    kernel_header(16)
+    for name, texts in LOGIC_KERNELS.items():
+        for kind, text in zip(('and/or', 'nested'), texts):
+            tree = Parser(RegexLexer(text.format(n=iterations)).get_next_token()).parse()
+            kernel_row(f'{name} {kind}', 16, tree, iterations)
+
+
+BENCHMARKS = {
+    'lexer': bench_lexers,
+    'stream': bench_stream,
+    'tokens': bench_token_memory,
+    'mmap': bench_mmap,
+    'incremental': bench_incremental,
+    'identifiers': bench_identifiers,
+    'parallel': bench_parallel,
+    'parser': bench_parsers,
+    'depth': bench_depth,
+    'cache': bench_cache,
+    'flat': bench_flat,
+    'optimizer': bench_optimizer,
+    'dispatch': bench_dispatch,
+    'operators': bench_operators,
+    'native': bench_native,
+    'vm': bench_vm,
+    'closure': bench_closure,
+    'slots': bench_slots,
+    'inline': bench_inline,
+    'python': bench_python,
+    'loops': bench_loops,
+    'for': bench_for,
+    'jumps': bench_jumps,
+    'logic': bench_logic,
+}
 
 
-text = open("main.bas", "r").read()
-re = run(text)
-print(re)
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[1] == 'bench':
+        BENCHMARKS[sys.argv[2]]()
+        exit(0)
+    if len(sys.argv) > 1 and sys.argv[1] == 'test':
+        test_calculator()
+        exit(0)
 
-for key, value in global_symbol_table.vars.items():
-    print(f"Key: {key}, Value: {value}")
+    # --cache keeps parse trees under ~/.cache/basic_7 between runs
+    args = sys.argv[1:]
+    cache = None
+    if '--cache' in args:
+        args.remove('--cache')
+        cache = CompileCache()
+    result = run_file(args[0] if args else "main.bas", cache=cache)
+    print(result)
 
+    for key, value in global_symbol_table.vars.items():
+        print(f"Key: {key}, Value: {value}")
@@ -38,4 +38,4 @@ var y = 0
 while (y < 5) then
   var j  = y
   y = y + 1
-endif
+endwhile